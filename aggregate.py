@@ -0,0 +1,148 @@
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from results_store import ResultsStore
+from rater_quality import RaterQuality
+
+METRICS = ["Natural-MOS", "Intelligibility-MOS", "Similarity-MOS"]
+
+
+def load_results(path):
+    """Load every rating into one DataFrame with a `tester_id` column.
+
+    `path` is a results directory (its `results.db` is used when present, otherwise its
+    per-tester CSV files) or a `results.db` file.
+    """
+    db_path = os.path.join(path, "results.db") if os.path.isdir(path) else path
+    if os.path.isfile(db_path):
+        rows = ResultsStore(db_path).ratings()
+        return pd.DataFrame(
+            [(r[0], r[3], r[4], r[5], r[6], r[7]) for r in rows],
+            columns=["tester_id", "filepath", "model"] + METRICS,
+        )
+    frames = []
+    for f in sorted(os.listdir(path)):
+        if f.endswith(".csv") and not f.startswith("_"):
+            frames.append(pd.read_csv(os.path.join(path, f)).assign(tester_id=f[:-len(".csv")]))
+    return pd.concat(frames, ignore_index=True)
+
+
+def exclude_flagged(df, min_items=10, min_consensus=0.2):
+    """Drop raters flagged by `RaterQuality.flagged`; return (filtered df, flagged ids)."""
+    quality = RaterQuality()
+    quality.load(df[["tester_id", "filepath"] + METRICS].itertuples(index=False, name=None))
+    flagged = quality.flagged(min_items=min_items, min_consensus=min_consensus)
+    return df[~df["tester_id"].isin(flagged)], flagged
+
+
+# Exact two-sided critical values for 1 to 10 degrees of freedom, where the expansion
+# in `t_critical` is least accurate.
+T_TABLE = {
+    0.9: [6.3138, 2.9200, 2.3534, 2.1318, 2.0150, 1.9432, 1.8946, 1.8595, 1.8331, 1.8125],
+    0.95: [12.7062, 4.3027, 3.1824, 2.7764, 2.5706, 2.4469, 2.3646, 2.3060, 2.2622, 2.2281],
+    0.99: [63.6567, 9.9248, 5.8409, 4.6041, 4.0321, 3.7074, 3.4995, 3.3554, 3.2498, 3.1693],
+}
+
+
+def t_critical(dof, confidence=0.95):
+    """Two-sided Student-t critical values for an array of degrees of freedom.
+
+    Integer dof up to 10 are looked up in `T_TABLE`. Larger (or fractional) dof use the
+    Cornish-Fisher expansion around the normal quantile, which is within 0.1% of the
+    exact value for dof >= 6 and avoids a SciPy dependency.
+    """
+    dof = np.asarray(dof, dtype=float)
+    z = {0.9: 1.6448536, 0.95: 1.9599640, 0.99: 2.5758293}.get(confidence)
+    if z is None:
+        raise ValueError("confidence must be one of 0.9, 0.95, 0.99")
+    z3, z5, z7 = z ** 3, z ** 5, z ** 7
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (z + (z3 + z) / (4 * dof) + (5 * z5 + 16 * z3 + 3 * z) / (96 * dof ** 2)
+             + (3 * z7 + 19 * z5 + 17 * z3 - 15 * z) / (384 * dof ** 3))
+    table = np.array(T_TABLE[confidence])
+    exact = (dof >= 1) & (dof <= len(table)) & (dof == np.round(dof))
+    index = np.clip(np.nan_to_num(dof), 1, len(table)).astype(int) - 1
+    t = np.where(exact, table[index], t)
+    return np.where(dof > 0, t, np.nan)
+
+
+def bootstrap_means(values, group_sizes, n_boot=2000, seed=0, max_cells=5_000_000):
+    """Bootstrap the mean of every group at once.
+
+    `values` must be sorted by group, with `group_sizes` giving the length of each run.
+    Returns an array of shape (n_boot, n_groups). Resamples are drawn in chunks of at most
+    `max_cells` values, and every chunk is one batched draw followed by a reduceat.
+    """
+    rng = np.random.default_rng(seed)
+    values = np.asarray(values, dtype=float)
+    group_sizes = np.asarray(group_sizes)
+    starts = np.concatenate([[0], np.cumsum(group_sizes)[:-1]])
+    col_start = np.repeat(starts, group_sizes)
+    col_size = np.repeat(group_sizes, group_sizes)
+    chunk = max(1, max_cells // max(len(values), 1))
+    means = np.empty((n_boot, len(group_sizes)))
+    for lo in range(0, n_boot, chunk):
+        hi = min(lo + chunk, n_boot)
+        draws = col_start + (rng.random((hi - lo, len(values))) * col_size).astype(np.int64)
+        means[lo:hi] = np.add.reduceat(values[draws], starts, axis=1) / group_sizes
+    return means
+
+
+def add_rater_z(df):
+    """Add `<metric>-z` columns: each score standardized within its rater."""
+    grouped = df.groupby("tester_id")[METRICS]
+    mean = grouped.transform("mean")
+    std = grouped.transform("std").replace(0, np.nan)
+    z = ((df[METRICS] - mean) / std).fillna(0.0)
+    return df.join(z.add_suffix("-z"))
+
+
+def aggregate(df, n_boot=2000, confidence=0.95, seed=0):
+    """Per-model, per-metric MOS with t-based and bootstrap confidence intervals."""
+    df = add_rater_z(df)
+    long = df.melt(id_vars=["model"], value_vars=METRICS, var_name="metric", value_name="score")
+    z_long = df.melt(id_vars=["model"], value_vars=[m + "-z" for m in METRICS],
+                     var_name="metric", value_name="z")
+    long["z"] = z_long["z"].to_numpy()
+    long = long.sort_values(["model", "metric"], kind="stable")
+
+    report = long.groupby(["model", "metric"]).agg(
+        n=("score", "size"), mean=("score", "mean"), std=("score", "std"), z_mean=("z", "mean"),
+    )
+    sem = report["std"] / np.sqrt(report["n"])
+    half_width = t_critical(report["n"] - 1, confidence) * sem
+    report["t_low"] = report["mean"] - half_width
+    report["t_high"] = report["mean"] + half_width
+
+    boot = bootstrap_means(long["score"].to_numpy(), report["n"].to_numpy(), n_boot=n_boot, seed=seed)
+    alpha = (1 - confidence) / 2
+    report["boot_low"], report["boot_high"] = np.quantile(boot, [alpha, 1 - alpha], axis=0)
+    return report.reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate MOS results per model.")
+    parser.add_argument("path", help="Results directory (e.g. results/20250101) or results.db file")
+    parser.add_argument("--bootstrap", type=int, default=2000, help="Number of bootstrap resamples")
+    parser.add_argument("--confidence", type=float, default=0.95, choices=[0.9, 0.95, 0.99])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Optional CSV file for the report")
+    parser.add_argument("--exclude-flagged", action="store_true",
+                        help="Leave out straight-lining raters and raters who disagree with the consensus")
+    parser.add_argument("--min-items", type=int, default=10, help="Items a rater needs before being judged")
+    parser.add_argument("--min-consensus", type=float, default=0.2,
+                        help="Lowest mean correlation with the other raters' consensus")
+    args = parser.parse_args()
+
+    df = load_results(args.path)
+    if args.exclude_flagged:
+        df, flagged = exclude_flagged(df, min_items=args.min_items, min_consensus=args.min_consensus)
+        print(f"Excluded {len(flagged)} raters: {', '.join(sorted(flagged))}")
+    report = aggregate(df, n_boot=args.bootstrap, confidence=args.confidence, seed=args.seed)
+    if args.out:
+        report.to_csv(args.out, index=False)
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(report.round(3).to_string(index=False))
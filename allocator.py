@@ -0,0 +1,79 @@
+import os
+import json
+import heapq
+import threading
+
+
+class SheetAllocator:
+    """Thread-safe assignment of sheet indices to testers, persisted across restarts.
+
+    Every sheet is handed out exactly once before any is reused; after that each new
+    tester gets the least-loaded sheet (lowest index on ties). A tester that already
+    holds a sheet always gets the same one back. With a `writer`, the allocation file is
+    written on its write-behind thread instead of inside `allocate`. Sheets can be added
+    while running, and retired sheets are never handed out again; once every sheet is
+    retired, new testers get None.
+    """
+
+    def __init__(self, num_sheets: int, path: str, writer=None):
+        self.path = path
+        self.writer = writer
+        self._lock = threading.Lock()
+        self.counts = [0] * num_sheets
+        self.assignments = {}
+        self.retired = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                saved = json.load(f)
+            for i, count in enumerate(saved["counts"][:num_sheets]):
+                self.counts[i] = count
+            self.assignments = {
+                tester_id: sheet for tester_id, sheet in saved["assignments"].items()
+                if sheet < num_sheets
+            }
+        self._heap = [(count, i) for i, count in enumerate(self.counts)]
+        heapq.heapify(self._heap)
+
+    def allocate(self, tester_id):
+        """Return the sheet index assigned to `tester_id`, assigning one if needed.
+
+        Returns None if the tester has no sheet and none can be assigned.
+        """
+        with self._lock:
+            if tester_id in self.assignments:
+                return self.assignments[tester_id]
+            # Retired sheets are dropped from the heap as they come up.
+            while self._heap and self._heap[0][1] in self.retired:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            count, sheet = heapq.heappop(self._heap)
+            self.counts[sheet] = count + 1
+            heapq.heappush(self._heap, (count + 1, sheet))
+            self.assignments[tester_id] = sheet
+            self._save()
+            return sheet
+
+    def add_sheets(self, num_sheets):
+        """Grow to `num_sheets` sheets; new ones start unassigned, so they are served first."""
+        with self._lock:
+            for sheet in range(len(self.counts), num_sheets):
+                self.counts.append(0)
+                heapq.heappush(self._heap, (0, sheet))
+
+    def retire(self, sheets):
+        with self._lock:
+            self.retired.update(sheets)
+
+    def _save(self):
+        payload = json.dumps({"counts": self.counts, "assignments": self.assignments})
+        if self.writer is None:
+            self._write(payload)
+        else:
+            self.writer.submit(self._write, payload, key=self.path)
+
+    def _write(self, payload):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
@@ -1,10 +1,85 @@
 import re
 import os
-import json
-import pandas as pd
+import copy
+import logging
+import sqlite3
+import threading
 import gradio as gr
 from datetime import datetime
 from display_text import DESCRIPTIONS
+from catalog import SampleCatalog
+from transcode import AudioTranscoder
+from loudness import LoudnessNormalizer
+from prefetch import Prefetcher
+from byte_cache import AudioByteCache
+from audio_route import AudioRoute, RoutedAudio
+from backend import LocalBackend, SqliteBackend
+from scheduler import AdaptiveScheduler, SCORE_KEYS
+from writer import WriteBehindQueue
+from metrics import Metrics, timed_handler
+from live_stats import LiveStats
+from rater_quality import RaterQuality
+from validate_audio import AudioValidator, log_problems
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+# With a shared state_db, seconds between pulls of other workers' ratings, and seconds of
+# already-synced history re-read by `MOSApp.sync_ratings`.
+SYNC_INTERVAL = 2.0
+
+
+class SharedResources:
+    """Process-wide objects shared by every study (`MOSApp`) served from one process.
+
+    The audio byte cache, the audio route and the prefetcher are shared outright, so a
+    file used by several studies (such as a common reference prompt) is read, hashed and
+    cached once. Catalogs, transcoders, normalizers and validators are shared by the
+    studies that name the same directory or cache file, which also keeps their index
+    files from being written by two objects at once. Catalogs that are polled for changes
+    are per study, because each study keeps its own sheet versions.
+    """
+
+    def __init__(self, audio_memory_budget: int = 256 * 1024 * 1024, audio_route: str = None,
+                 audio_secret: str = None):
+        self.byte_cache = AudioByteCache(max_bytes=audio_memory_budget)
+        # `audio_route` is the URL prefix of an `AudioRoute` the caller mounts on its FastAPI
+        # app (see run.py). Without it, audio is served from Gradio's file cache. Workers
+        # given the same `audio_secret` accept each other's audio URLs.
+        self.audio_route = None
+        if audio_route is not None:
+            self.audio_route = AudioRoute(self.byte_cache, prefix=audio_route, secret=audio_secret)
+        self.prefetcher = Prefetcher(self.byte_cache, audio_route=self.audio_route)
+        self._lock = threading.Lock()
+        self._objects = {}
+
+    def _get(self, key, factory):
+        with self._lock:
+            if key not in self._objects:
+                self._objects[key] = factory()
+            return self._objects[key]
+
+    def catalog(self, dirpath, max_loaded=None, store_dir=None):
+        if store_dir is not None:
+            return SampleCatalog.open(dirpath, max_loaded=max_loaded, store_dir=store_dir)
+        key = ("catalog", os.path.realpath(dirpath), max_loaded)
+        return self._get(key, lambda: SampleCatalog.open(dirpath, max_loaded=max_loaded))
+
+    def transcoder(self, cache_dir):
+        return self._get(("transcoder", os.path.realpath(cache_dir)), lambda: AudioTranscoder(cache_dir))
+
+    def normalizer(self, cache_dir):
+        return self._get(("normalizer", os.path.realpath(cache_dir)), lambda: LoudnessNormalizer(cache_dir))
+
+    def validator(self, cache_path):
+        return self._get(("validator", os.path.realpath(cache_path)), lambda: AudioValidator(cache_path))
+
+    def close(self):
+        self.prefetcher.shutdown()
+        for obj in self._objects.values():
+            if isinstance(obj, AudioTranscoder):
+                obj.shutdown()
 
 
 class MOSApp:
@@ -21,50 +96,312 @@ class MOSApp:
         "5 - Excellent": 5
     }
 
-    def __init__(self, dirpath: str, outdir: str, progress_dir: str):
-        csv_files = os.listdir(dirpath)
-        self.dfs = [pd.read_csv(os.path.join(dirpath, f)) for f in csv_files]
-        self.current_files = None
-        self.current_transcripts = None
-        self.current_models = None
-        self.current_gt = None
-        self.id_to_take = 0
+    def __init__(self, dirpath: str, outdir: str, progress_dir: str, audio_cache_dir: str = None,
+                 audio_memory_budget: int = 256 * 1024 * 1024, max_loaded_sheets: int = None,
+                 scheduling: str = None, state_db: str = None, metrics: bool = False,
+                 audio_validation_cache: str = None, loudness_cache_dir: str = None,
+                 reload_interval: float = None, audio_route: str = None, shared: SharedResources = None):
+        # `dirpath` is a directory of CSV sheets or a single-file store built by sheet_store.py.
+        # Sheets are parsed on first assignment, in sorted file order so that
+        # persisted allocations keep referring to the same files. With `reload_interval`,
+        # a CSV directory is polled for changes, and every sheet version is kept under
+        # `progress_dir/_sheets` so sessions keep the version they were assigned.
+        # Several studies in one process pass the same `shared` resources; `audio_memory_budget`
+        # and `audio_route` then come from those.
+        self.shared = shared if shared is not None else SharedResources(audio_memory_budget, audio_route)
+        self._owns_shared = shared is None
+        store_dir = os.path.join(progress_dir, "_sheets") if reload_interval else None
+        self.catalog = self.shared.catalog(dirpath, max_loaded=max_loaded_sheets, store_dir=store_dir)
+        # Handler and I/O timings plus session counters, served by run.py at /metrics.
+        self.metrics = Metrics(enabled=metrics)
+        # With a cache path, every referenced WAV is checked before any rater connects;
+        # problem rows are logged and kept in `audio_problems`.
+        self.audio_problems = []
+        if audio_validation_cache is not None:
+            self.audio_problems = self.shared.validator(audio_validation_cache).validate(self.catalog)
+            log_problems(self.audio_problems)
         self.outdir = outdir
         self.rev_mos = {v: k for k, v in self.MOS_SCORES.items()}
         os.makedirs(outdir, exist_ok=True)
+        # Every state and result write goes through this queue so handlers never block on disk.
+        self.writer = WriteBehindQueue()
+        self.metrics.gauge("write_backlog", self.writer.pending, "Queued state and result writes not on disk yet.")
         self.progress_dir = progress_dir
-        os.makedirs(progress_dir, exist_ok=True)
+        # Allocation, progress and results live in the backend. `state_db` names a SQLite
+        # file shared by every worker process; without it, state is local to this process.
+        if state_db is not None:
+            self.backend = SqliteBackend(len(self.catalog), state_db)
+        else:
+            self.backend = LocalBackend(len(self.catalog), outdir, progress_dir, writer=self.writer)
+        self.backend.retire(self.catalog.retired())
+        self.normalizer = None
+        if loudness_cache_dir is not None:
+            # Normalized copies are made offline with `loudness.py`; files without one play as they are.
+            self.normalizer = self.shared.normalizer(loudness_cache_dir)
+        self.transcoder = None
+        if audio_cache_dir is not None:
+            # Sheets are transcoded when they are assigned; run `transcode.py` to do it ahead of time.
+            self.transcoder = self.shared.transcoder(audio_cache_dir)
+
+        self.byte_cache = self.shared.byte_cache
+        self.audio_route = self.shared.audio_route
+        self.prefetcher = self.shared.prefetcher
+        for name, help_text in (
+            ("entries", "Files held in the audio byte cache."),
+            ("bytes", "Bytes held in the audio byte cache."),
+            ("hits", "Audio byte cache hits since startup."),
+            ("misses", "Audio byte cache misses since startup."),
+            ("evictions", "Audio byte cache evictions since startup."),
+        ):
+            self.metrics.gauge(f"audio_cache_{name}", lambda name=name: self.byte_cache.stats()[name], help_text)
+        # With scheduling="count" or "ci", each session still gets a sheet (which sets its
+        # length), but its items are picked one by one from the whole catalog.
+        self.scheduler = None
+        ratings = self.backend.ratings()
+        if scheduling is not None:
+            self.scheduler = AdaptiveScheduler(self.catalog, policy=scheduling)
+            if state_db is None:
+                self.scheduler.load(row[3:4] + row[5:] for row in ratings)
+        # Inter-rater reliability and per-rater consensus, served at /raters.
+        self.rater_quality = RaterQuality()
+        # Per-model running MOS for the /scoreboard endpoint, rebuilt from the stored ratings.
+        self.live_stats = LiveStats(os.path.join(outdir, "_live_stats.json"), writer=self.writer)
+        # With a shared state_db, ratings submitted through other workers are pulled from the
+        # database by `sync_ratings` instead (also for rater quality and the scheduler), keyed
+        # by (tester, item) to apply revisions. `_scheduled` holds the (scheduler item, scores)
+        # the scheduler counts for each rating, so this worker's own submits are not counted
+        # again when they come back from the database.
+        self._synced = None
+        self._stop_syncing = threading.Event()
+        if state_db is not None:
+            self._synced = {}
+            self._scheduled = {}
+            self._sync_lock = threading.Lock()
+            self._sync_watermark = 0
+            self.sync_ratings()
+            threading.Thread(target=self._sync_periodically, name="mos-sync", daemon=True).start()
+        else:
+            self.live_stats.load(row[:1] + row[4:] for row in ratings)
+            self.rater_quality.load(row[:1] + row[3:4] + row[5:] for row in ratings)
+        self._stop_watching = None
+        if reload_interval:
+            self._stop_watching = self.catalog.watch(reload_interval, self.sheets_changed)
+
+    def sheets_changed(self, added, retired):
+        """Make newly added sheets assignable and stop assigning retired ones."""
+        self.backend.add_sheets(len(self.catalog))
+        self.backend.retire(retired)
+        if self.scheduler is not None:
+            # A changed sheet arrives as a new id plus its retired old one; adding first keeps
+            # the rows the two versions share schedulable throughout.
+            for sheet_id in added:
+                self.scheduler.add_sheet(sheet_id, self.catalog.load(sheet_id))
+            for sheet_id in retired:
+                self.scheduler.retire_sheet(sheet_id)
+
+    def sync_ratings(self):
+        """Apply the ratings stored by any worker since the last call (shared state_db only)."""
+        if self._synced is None:
+            return
+        with self._sync_lock:
+            # Sequence numbers are assigned in commit order, so every row past the
+            # watermark is new or a revision of one applied before.
+            rows = self.backend.ratings_since(self._sync_watermark)
+            for tester_id, item, filepath, model, *scores, seq in rows:
+                previous = self._synced.get((tester_id, item))
+                if previous is not None:
+                    self.live_stats.remove(*previous, tester_id)
+                self.live_stats.add(model, scores, tester_id)
+                # Replaces this rater's earlier scores for the item, so local submits seen
+                # again here are not counted twice.
+                self.rater_quality.add(tester_id, filepath, scores)
+                self._synced[tester_id, item] = (model, scores)
+                if self.scheduler is not None:
+                    self._schedule((tester_id, item), self.scheduler.ids.get(filepath), scores)
+                self._sync_watermark = seq
+
+    def _schedule(self, key, item, scores, handed_out=False):
+        """Make the scheduler count `scores` for the rating `key` in place of what it counted before."""
+        previous = self._scheduled.get(key)
+        if previous == (item, scores):
+            return
+        if previous is not None:
+            self.scheduler.remove(*previous)
+        if item is None:
+            # The item is not in any sheet this worker schedules from.
+            self._scheduled.pop(key, None)
+            return
+        self.scheduler.record(item, scores, handed_out=handed_out)
+        self._scheduled[key] = (item, scores)
+
+    def _sync_periodically(self):
+        while not self._stop_syncing.wait(SYNC_INTERVAL):
+            try:
+                self.sync_ratings()
+            except sqlite3.Error:
+                logger.exception("Syncing ratings from the shared database failed")
+
+    def _session_sheet(self, state):
+        """Return the sheet a session works through, scheduling its next item if needed."""
+        sheet = self.catalog[state["sheet_id"]]
+        if self.scheduler is None:
+            return sheet
+        items = state.setdefault("items", [])
+        length = len(sheet)
+        while len(items) <= state["index"] < length:
+            item = self.scheduler.next_item(exclude=items)
+            if item is None:
+                # Every remaining item repeats an utterance this rater has already heard.
+                length = len(items)
+                break
+            items.append(item)
+            if self.transcoder is not None:
+                self.transcoder.warm_in_background(map(self.source_path, self.scheduler.rows[item][:2]))
+        return self.scheduler.sheet(items, length)
+
+    def source_path(self, path):
+        """Return the loudness-normalized copy of a sheet's `path`, if there is one."""
+        if self.normalizer is None:
+            return path
+        return self.normalizer.resolve(path)
+
+    def encoded_path(self, path):
+        """Return the transcoded copy of a sheet's (normalized) `path`, if there is one."""
+        path = self.source_path(path)
+        if self.transcoder is None:
+            return path
+        return self.transcoder.resolve(path)
+
+    def audio_src(self, path):
+        """Return the file to hand to the audio players for a sheet's `path`."""
+        with self.metrics.timer("step", "resolve_audio"):
+            path = self.encoded_path(path)
+            if self.audio_route is not None:
+                try:
+                    return self.audio_route.url(path)
+                except OSError:
+                    return path
+            return self.prefetcher.staged(path) or path
+
+    @timed_handler
+    def prefetch(self, state):
+        """Warm the next items of the tester's sheet and return browser prefetch hints for them."""
+        if state["sheet_id"] is None:
+            return ""
+        sheet = self._session_sheet(state)
+        start = state["index"] + 1
+        paths = [
+            self.encoded_path(path)
+            for i in range(start, min(start + self.prefetcher.depth, len(sheet.filepath)))
+            for path in (sheet.filepath[i], sheet.gt[i])
+        ]
+        self.prefetcher.warm(paths)
+        return self.prefetcher.hints(paths)
+
+    def close(self):
+        """Flush pending writes and release open files; call on shutdown."""
+        if self._stop_watching is not None:
+            self._stop_watching.set()
+        self._stop_syncing.set()
+        self.live_stats.persist()
+        self.writer.close()
+        self.backend.close()
+        if self._owns_shared:
+            self.shared.close()
 
     def save_state(self, state):
-        """Save the current state to a JSON file using tester_id as filename."""
+        """Queue a full snapshot of the current state using tester_id as filename."""
+        if state.get("tester_id"):
+            self.writer.submit(
+                self.metrics.wrap("step", "save_snapshot", self.backend.save_snapshot),
+                copy.deepcopy(state),
+                key=("snapshot", state["tester_id"]),
+                tag=state["tester_id"],
+            )
+        return
+
+    def record_rating(self, state, index, previous=None, listening=""):
+        """Append the scores submitted at `index` to the tester's rating log and the results store.
+
+        `previous` holds the replaced scores when the tester is revising an item they
+        already rated. `listening` is the client's telemetry batch for the item, stored
+        next to the scores.
+        """
         if state.get("tester_id"):
-            progress_path = os.path.join(self.progress_dir, f"{state['tester_id']}.json")
-            with open(progress_path, "w") as f:
-                json.dump(state, f)
+            self.metrics.inc("ratings")
+            self.metrics.touch(state["tester_id"])
+            self.writer.submit(
+                self.metrics.wrap("step", "append_rating", self.backend.append_rating),
+                copy.deepcopy(state),
+                index,
+                tag=state["tester_id"],
+            )
+            scores = [state[key][index] for key in SCORE_KEYS]
+            if self.scheduler is not None and self._synced is not None:
+                with self._sync_lock:
+                    self._schedule((state["tester_id"], index), state["items"][index], scores,
+                                   handed_out=previous is None)
+            elif self.scheduler is not None:
+                if previous is None:
+                    self.scheduler.record(state["items"][index], scores)
+                else:
+                    self.scheduler.remove(state["items"][index], previous)
+                    self.scheduler.record(state["items"][index], scores, handed_out=False)
+            sheet = self._session_sheet(state)
+            if self._synced is None:
+                if previous is not None:
+                    self.live_stats.remove(sheet.model[index], previous, state["tester_id"])
+                self.live_stats.add(sheet.model[index], scores, state["tester_id"])
+            self.rater_quality.add(state["tester_id"], sheet.filepath[index], scores)
+            self.writer.submit(
+                self.metrics.wrap("step", "record_result", self.backend.record_result),
+                state["tester_id"],
+                state["sheet_id"],
+                index,
+                sheet.filepath[index],
+                sheet.model[index],
+                state["selected_naturalness_MOS"][index],
+                state["selected_intelligibility_MOS"][index],
+                state["selected_similarity_MOS"][index],
+            )
+            summary, events = telemetry.summarize(listening)
+            self.writer.submit(
+                self.metrics.wrap("step", "record_telemetry", self.backend.record_telemetry),
+                state["tester_id"],
+                index,
+                sheet.filepath[index],
+                summary,
+                events,
+            )
         return
 
     def load_state(self, tester_id):
-        """Load the state for a given tester_id if it exists."""
-        progress_path = os.path.join(self.progress_dir, f"{tester_id}.json")
-        if os.path.exists(progress_path):
-            with open(progress_path, "r") as f:
-                return json.load(f)
-        return None
-
-    def get_current_info(self):
-        if self.id_to_take >= len(self.dfs):
-            self.id_to_take = 0
-        self.current_files = self.dfs[self.id_to_take]["filepath"].tolist()
-        self.current_transcripts = self.dfs[self.id_to_take]["transcript"].tolist()
-        self.current_models = self.dfs[self.id_to_take]["model"].tolist()
-        self.current_gt = self.dfs[self.id_to_take]["gt"].tolist()
-        self.id_to_take += 1
-        return (
-            self.current_files,
-            self.current_transcripts,
-            self.current_models,
-            self.current_gt,
-        )
+        """Load the state for a given tester_id if it exists, replaying its rating log."""
+        # Make sure queued writes for this tester have landed before reading them back.
+        with self.metrics.timer("step", "flush_writes"):
+            self.writer.flush(tag=tester_id)
+        with self.metrics.timer("step", "load_state"):
+            state = self.backend.load(tester_id)
+        if state is not None and "sheet_id" not in state:
+            # Progress saved before the catalog existed carries full copies of the sheet.
+            state["sheet_id"] = self.catalog.find(state["current_files"])
+            for key in ("current_files", "current_transcripts", "current_models", "current_gt"):
+                state.pop(key, None)
+            if state["sheet_id"] is None:
+                return None
+        return state
+
+    def get_current_info(self, tester_id):
+        """Return the id of the catalog sheet assigned to `tester_id`, or None if every sheet is retired."""
+        with self.metrics.timer("step", "allocate"):
+            sheet_id = self.backend.allocate(tester_id)
+        if sheet_id is None:
+            return None
+        self.metrics.inc("assignments")
+        if self.transcoder is not None and self.scheduler is None:
+            sheet = self.catalog[sheet_id]
+            self.transcoder.warm_in_background(map(self.source_path, sheet.filepath + sheet.gt))
+        return sheet_id
 
     def initialize_state(self):
         return {
@@ -73,25 +410,40 @@ class MOSApp:
             "selected_intelligibility_MOS": [],
             "selected_similarity_MOS": [],
             "tester_id": "",
-            "current_files": None,
-            "current_transcripts": None,
-            "current_models": None,
-            "current_gt": None,
+            "sheet_id": None,
+            # Item ids served so far, used only with adaptive scheduling.
+            "items": [],
         }
 
-    def submit_options(self, naturalness, intelligibility, similarity, state):
+    @timed_handler
+    def submit_options(self, naturalness, intelligibility, similarity, state, listening=""):
+
+        if state["sheet_id"] is None:
+            return (
+                None,
+                None,
+                None,
+                None,
+                state,
+                "",
+                None,
+                gr.update(),
+                gr.update(),
+                gr.update(),
+            )
+        sheet = self._session_sheet(state)
 
         # Warn if any score is not selected
         if naturalness is None:
             gr.Warning("Please rate NATURALNESS before submitting.", duration=5)
             return (
-                state["current_files"][state["index"]],
+                self.audio_src(sheet.filepath[state["index"]]),
                 naturalness,
                 intelligibility,
                 similarity,
                 state,
-                state["current_transcripts"][state["index"]],
-                state["current_gt"][state["index"]],
+                sheet.transcript[state["index"]],
+                self.audio_src(sheet.gt[state["index"]]),
                 gr.update(),
                 gr.update(),
                 gr.update(),
@@ -99,13 +451,13 @@ class MOSApp:
         if intelligibility is None:
             gr.Warning("Please rate INTELLIGIBILITY before submitting.", duration=5)
             return (
-                state["current_files"][state["index"]],
+                self.audio_src(sheet.filepath[state["index"]]),
                 naturalness,
                 intelligibility,
                 similarity,
                 state,
-                state["current_transcripts"][state["index"]],
-                state["current_gt"][state["index"]],
+                sheet.transcript[state["index"]],
+                self.audio_src(sheet.gt[state["index"]]),
                 gr.update(),
                 gr.update(),
                 gr.update(),
@@ -113,28 +465,13 @@ class MOSApp:
         if similarity is None:
             gr.Warning("Please rate SIMILARITY before submitting.", duration=5)
             return (
-                state["current_files"][state["index"]],
+                self.audio_src(sheet.filepath[state["index"]]),
                 naturalness,
                 intelligibility,
                 similarity,
                 state,
-                state["current_transcripts"][state["index"]],
-                state["current_gt"][state["index"]],
-                gr.update(),
-                gr.update(),
-                gr.update(),
-            )
-
-        current_files = state["current_files"]
-        if not current_files:
-            return (
-                None,
-                None,
-                None,
-                None,
-                state,
-                "",
-                None,
+                sheet.transcript[state["index"]],
+                self.audio_src(sheet.gt[state["index"]]),
                 gr.update(),
                 gr.update(),
                 gr.update(),
@@ -144,41 +481,40 @@ class MOSApp:
 
         # If the current index is less than submitted_count, we are editing a past evaluation.
         if state["index"] < submitted_count:
+            previous = [state[key][state["index"]] for key in SCORE_KEYS]
             state["selected_naturalness_MOS"][state["index"]] = self.MOS_SCORES[naturalness]
             state["selected_intelligibility_MOS"][state["index"]] = self.MOS_SCORES[intelligibility]
             state["selected_similarity_MOS"][state["index"]] = self.MOS_SCORES[similarity]
             state["index"] += 1
-            audio = current_files[state["index"]]
-            transcript = state["current_transcripts"][state["index"]]
-            gt = state["current_gt"][state["index"]]
-            self.save_state(state)
+            self.record_rating(state, state["index"] - 1, previous=previous, listening=listening)
+            sheet = self._session_sheet(state)
+            audio = self.audio_src(sheet.filepath[state["index"]])
+            transcript = sheet.transcript[state["index"]]
+            gt = self.audio_src(sheet.gt[state["index"]])
         elif state["index"] == submitted_count:
             # New evaluation: append the scores.
             state["selected_naturalness_MOS"].append(self.MOS_SCORES[naturalness])
             state["selected_intelligibility_MOS"].append(self.MOS_SCORES[intelligibility])
             state["selected_similarity_MOS"].append(self.MOS_SCORES[similarity])
             state["index"] += 1  # Move to the next evaluation.
-            if state["index"] < len(current_files):
-                audio = current_files[state["index"]]
-                transcript = state["current_transcripts"][state["index"]]
-                gt = state["current_gt"][state["index"]]
+            self.record_rating(state, state["index"] - 1, listening=listening)
+            sheet = self._session_sheet(state)
+            if state["index"] < len(sheet):
+                audio = self.audio_src(sheet.filepath[state["index"]])
+                transcript = sheet.transcript[state["index"]]
+                gt = self.audio_src(sheet.gt[state["index"]])
             else:
                 audio, transcript, gt = None, "", None
-            self.save_state(state)
         else:
             audio, transcript, gt = None, "", None
 
-        # If the user has finished all evaluations, save CSV.
-        if state["index"] >= len(current_files):
-            results_df = pd.DataFrame({
-                "filepath": state["current_files"],
-                "model": state["current_models"],
-                "Natural-MOS": state["selected_naturalness_MOS"],
-                "Intelligibility-MOS": state["selected_intelligibility_MOS"],
-                "Similarity-MOS": state["selected_similarity_MOS"],
-            })
-            csv_path = os.path.join(self.outdir, f"{state['tester_id']}.csv")
-            results_df.to_csv(csv_path, index=False)
+        # If the user has finished all evaluations. Scores are already in the results
+        # store; per-tester CSVs are exported on demand with `results_store.py`.
+        if state["index"] >= len(sheet):
+            # Fold the rating log into a final snapshot.
+            self.save_state(state)
+            self.metrics.inc("completed_sheets")
+            self.metrics.finish(state["tester_id"])
             gr.Success("Thank you for your feedback! Evaluation finished.", duration=5)
             # Disable navigation buttons when finished.
             return (
@@ -212,8 +548,10 @@ class MOSApp:
                 next_update,
             )
 
+    @timed_handler
     def set_tester_id(self, id, state):
 
+        self.metrics.touch(id)
         # Try to load an existing state
         loaded_state = self.load_state(id)
 
@@ -223,24 +561,24 @@ class MOSApp:
             id_display_text = f"## Welcome back! Your ID: {state['tester_id']}"
         else:
             # No saved state; initialize a new one.
-            (
-                state["current_files"],
-                state["current_transcripts"],
-                state["current_models"],
-                state["current_gt"],
-            ) = self.get_current_info()
+            sheet_id = self.get_current_info(id)
+            if sheet_id is None:
+                gr.Warning("There are no samples left to rate. Please try again later.", duration=10)
+                return (gr.update(), state, *[gr.update()] * 10)
+            state["sheet_id"] = sheet_id
             state["tester_id"] = id
             state["index"] = 0
             # Save the new state
             self.save_state(state)
             id_display_text = f"## Your ID: {state['tester_id']}"
 
+        sheet = self._session_sheet(state)
         return (
             id_display_text,
             state,
-            state["current_files"][state["index"]],
-            state["current_transcripts"][state["index"]],
-            state["current_gt"][state["index"]],
+            self.audio_src(sheet.filepath[state["index"]]),
+            sheet.transcript[state["index"]],
+            self.audio_src(sheet.gt[state["index"]]),
             gr.update(visible=False, interactive=False),
             gr.update(visible=False, interactive=False),
             gr.update(interactive=False),
@@ -250,6 +588,7 @@ class MOSApp:
             gr.update(value=state["index"] + 1),
         )
 
+    @timed_handler
     def go_back(self, state):
         submitted_count = len(state["selected_naturalness_MOS"])
         if state["index"] > 0:
@@ -268,10 +607,11 @@ class MOSApp:
         next_update = gr.update(interactive=True) if state["index"] < submitted_count \
             else gr.update(interactive=False)
 
+        sheet = self._session_sheet(state)
         return (
-            state["current_files"][state["index"]],
-            state["current_transcripts"][state["index"]],
-            state["current_gt"][state["index"]],
+            self.audio_src(sheet.filepath[state["index"]]),
+            sheet.transcript[state["index"]],
+            self.audio_src(sheet.gt[state["index"]]),
             naturalness,
             intelligibility,
             similarity,
@@ -281,6 +621,7 @@ class MOSApp:
             next_update,
         )
 
+    @timed_handler
     def go_next(self, state):
         submitted_count = len(state["selected_naturalness_MOS"])
         if state["index"] < submitted_count:
@@ -299,10 +640,11 @@ class MOSApp:
         next_update = gr.update(interactive=True) if state["index"] < submitted_count \
             else gr.update(interactive=False)
 
+        sheet = self._session_sheet(state)
         return (
-            state["current_files"][state["index"]],
-            state["current_transcripts"][state["index"]],
-            state["current_gt"][state["index"]],
+            self.audio_src(sheet.filepath[state["index"]]),
+            sheet.transcript[state["index"]],
+            self.audio_src(sheet.gt[state["index"]]),
             naturalness,
             intelligibility,
             similarity,
@@ -333,7 +675,7 @@ class MOSApp:
 
     def create_interface(self):
 
-        with gr.Blocks(theme='davehornik/Tealy', fill_width=True, title="MOS Survey") as demo:
+        with gr.Blocks(theme='davehornik/Tealy', fill_width=True, title="MOS Survey", js=telemetry.SETUP_JS) as demo:
             def hello():
                 gr.Info("Hello! Please read the sidebar instructions carefully before starting the survey.")
 
@@ -390,17 +732,29 @@ class MOSApp:
             gr.Markdown("------")
             gr.Markdown("## Step 2. Listen carefully to the following audio: ")
 
+            # Route URLs from `audio_src` need the player that loads them directly.
+            audio_component = RoutedAudio if self.audio_route is not None else gr.Audio
             with gr.Row(equal_height=True):
                 with gr.Column(scale=2):
-                    display_audio = gr.Audio(None, type="filepath", label="Synthesized Voice")
+                    display_audio = audio_component(None, type="filepath", label="Synthesized Voice")
 
                 with gr.Column(scale=2):
-                    gt_display_audio = gr.Audio(None, type="filepath", label="Reference Voice")
+                    gt_display_audio = audio_component(None, type="filepath", label="Reference Voice")
 
                 with gr.Column(scale=1):
-                    progress_bar = gr.Slider(minimum=1, maximum=len(self.dfs[0]), value=0, label="Progress", interactive=False)
+                    progress_bar = gr.Slider(minimum=1, maximum=self.catalog.row_count(0), value=0, label="Progress", interactive=False)
                     transcript_box = gr.Textbox(label="Ground-truth Transcript", interactive=False)
 
+            # Holds <link rel="prefetch"> tags for the upcoming items; renders nothing visible.
+            prefetch_html = gr.HTML()
+            # Playback events are recorded in the browser only and uploaded with the next submit.
+            listening_box = gr.Textbox(visible=False)
+            for player, audio in (("synth", display_audio), ("ref", gt_display_audio)):
+                for kind in ("play", "pause", "stop"):
+                    getattr(audio, kind)(None, js=telemetry.record_js(player, kind))
+            if self.audio_route is None:
+                self.prefetcher.cache_dir = display_audio.GRADIO_CACHE
+
             gr.Markdown("------")
 
             gr.Markdown(
@@ -532,6 +886,12 @@ class MOSApp:
                     back_btn,
                     next_btn,
                 ],
+                js=telemetry.RESET_JS,
+            ).then(
+                self.prefetch,
+                inputs=[state],
+                outputs=[prefetch_html],
+                show_progress="hidden",
             )
             next_btn.click(
                 self.go_next,
@@ -548,6 +908,12 @@ class MOSApp:
                     back_btn,
                     next_btn,
                 ],
+                js=telemetry.RESET_JS,
+            ).then(
+                self.prefetch,
+                inputs=[state],
+                outputs=[prefetch_html],
+                show_progress="hidden",
             )
 
             language_toggle.change(
@@ -581,10 +947,16 @@ class MOSApp:
                     similarity,
                     progress_bar,
                 ],
+                js=telemetry.RESET_JS,
+            ).then(
+                self.prefetch,
+                inputs=[state],
+                outputs=[prefetch_html],
+                show_progress="hidden",
             )
             submit_btn.click(
                 self.submit_options,
-                inputs=[naturalness, intelligibility, similarity, state],
+                inputs=[naturalness, intelligibility, similarity, state, listening_box],
                 outputs=[
                     display_audio,
                     naturalness,
@@ -597,6 +969,12 @@ class MOSApp:
                     back_btn,
                     next_btn,
                 ],
+                js=telemetry.TAKE_JS,
+            ).then(
+                self.prefetch,
+                inputs=[state],
+                outputs=[prefetch_html],
+                show_progress="hidden",
             )
 
         return demo
@@ -609,7 +987,11 @@ if __name__ == "__main__":
         dirpath="./samples/data",   # change as you need
         outdir=f"./results/{current_date}",
         progress_dir=f"./progress/{current_date}",
+        audio_cache_dir="./cache/audio",
+        audio_validation_cache="./cache/audio_validation.json",
+        loudness_cache_dir="./cache/loudness",
     )
     demo = app.create_interface()
     demo.launch(share=True)
     # demo.launch(server_name="0.0.0.0", server_port=port)
+    app.close()
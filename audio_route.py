@@ -0,0 +1,134 @@
+import os
+import re
+import hmac
+import hashlib
+import threading
+import urllib.parse
+
+import gradio as gr
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from gradio.data_classes import FileData
+
+MEDIA_TYPES = {
+    ".wav": "audio/wav",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".mp3": "audio/mpeg",
+    ".flac": "audio/flac",
+}
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class AudioUrl(str):
+    """A URL served by `AudioRoute`; `RoutedAudio` hands it to the browser unchanged."""
+
+
+class RoutedAudio(gr.Audio):
+    """`gr.Audio` that plays `AudioUrl` values from the audio route.
+
+    Gradio copies every file value into its own cache and serves it from its file route.
+    A value without Gradio's file marker is passed to the browser as it is, so the player
+    loads the URL directly. Any other value is handled like in `gr.Audio`.
+    """
+
+    def get_block_name(self):
+        return "audio"
+
+    def postprocess(self, value):
+        if isinstance(value, AudioUrl):
+            path = urllib.parse.unquote(value.rsplit("/", 1)[1])
+            return FileData(path=value, url=value, orig_name=os.path.basename(path),
+                            mime_type=MEDIA_TYPES.get(os.path.splitext(path)[1].lower()),
+                            meta={"_type": "mos.AudioUrl"})
+        return super().postprocess(value)
+
+
+class AudioRoute:
+    """HTTP route serving sample audio at content-addressed URLs.
+
+    URLs have the form `<prefix>/<hash>/<signature>/<quoted path>`, where the hash is a
+    SHA-256 of the file content. A URL therefore never changes meaning, so responses carry
+    the hash as a strong ETag and an immutable Cache-Control header, and the browser never
+    asks for the same file twice. The signature is an HMAC of hash and path under `secret`,
+    so only URLs made by `url` are served, by any process that has the same secret (a
+    random one per process by default), and only while the content still matches the hash;
+    anything else is a 404 without touching the file. Hashes are memoized per (mtime,
+    size) and computed from the shared `byte_cache`, which also answers Range requests.
+    Other requests are sent with a `FileResponse`, which uses the server's zero-copy file
+    sending where available.
+    """
+
+    def __init__(self, byte_cache, prefix: str = "/audio", max_age: int = 365 * 24 * 3600,
+                 secret: str = None):
+        self.byte_cache = byte_cache
+        self._secret = secret.encode("utf-8") if secret is not None else os.urandom(32)
+        self.prefix = prefix.rstrip("/")
+        self.cache_control = f"public, max-age={max_age}, immutable"
+        self._lock = threading.Lock()
+        # path -> (mtime_ns, size, content hash)
+        self._digests = {}
+
+    def digest(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        digest = hashlib.sha256(self.byte_cache.get(path)).hexdigest()[:32]
+        with self._lock:
+            self._digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def signature(self, digest, path):
+        return hmac.new(self._secret, f"{digest}/{path}".encode("utf-8", "surrogateescape"),
+                        hashlib.sha256).hexdigest()[:32]
+
+    def url(self, path):
+        """Return the URL of `path`; raises OSError if it cannot be read."""
+        digest = self.digest(path)
+        return AudioUrl(f"{self.prefix}/{digest}/{self.signature(digest, path)}/"
+                        f"{urllib.parse.quote(path, safe='')}")
+
+    def mount(self, app):
+        """Add the route to a FastAPI `app`."""
+        app.add_api_route(self.prefix + "/{digest}/{signature}/{path:path}", self.serve,
+                          methods=["GET", "HEAD"])
+
+    def serve(self, request: Request, digest: str, signature: str, path: str):
+        # A plain function, so FastAPI runs it in its thread pool while hashing or reading.
+        media_type = MEDIA_TYPES.get(os.path.splitext(path)[1].lower())
+        if media_type is None or not hmac.compare_digest(signature, self.signature(digest, path)):
+            return Response(status_code=404)
+        try:
+            if not os.path.isfile(path) or self.digest(path) != digest:
+                return Response(status_code=404)
+        except OSError:
+            return Response(status_code=404)
+        etag = f'"{digest}"'
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Accept-Ranges": "bytes"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in if_none_match):
+            return Response(status_code=304, headers=headers)
+        byte_range = request.headers.get("range")
+        if byte_range is None:
+            return FileResponse(path, headers=headers, media_type=media_type)
+        # FileResponse would act on the Range header itself, so ranged requests are answered here.
+        data = self.byte_cache.get(path)
+        size = len(data)
+        match = RANGE_RE.match(byte_range.strip())
+        first, last = match.groups() if match else ("", "")
+        # Multiple, malformed (e.g. bytes=5-3) and stale (If-Range) ranges are ignored,
+        # and the whole file is sent.
+        if (not (first or last) or (first and last and int(first) > int(last))
+                or request.headers.get("if-range", etag) != etag):
+            return Response(bytes(data), headers=headers, media_type=media_type)
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+        if start >= size or end < start:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(bytes(data[start:end + 1]), status_code=206, headers=headers, media_type=media_type)
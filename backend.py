@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from rating_log import RatingLog
+from state_codec import encode, decode, validate
+from allocator import SheetAllocator
+from results_store import ResultsStore
+
+
+class LocalBackend:
+    """State kept by a single process: per-tester progress files, a JSON allocation file
+    and the results store under `outdir`.
+    """
+
+    def __init__(self, num_sheets: int, outdir: str, progress_dir: str, writer=None):
+        self.rating_log = RatingLog(progress_dir)
+        # Tester IDs are alphanumeric, so the underscore keeps this clear of progress files.
+        self.allocator = SheetAllocator(
+            num_sheets, os.path.join(progress_dir, "_allocations.json"), writer=writer
+        )
+        self.results = ResultsStore(os.path.join(outdir, "results.db"))
+
+    def allocate(self, tester_id):
+        return self.allocator.allocate(tester_id)
+
+    def add_sheets(self, num_sheets):
+        self.allocator.add_sheets(num_sheets)
+
+    def retire(self, sheet_ids):
+        self.allocator.retire(sheet_ids)
+
+    def save_snapshot(self, state):
+        self.rating_log.write_snapshot(state)
+
+    def append_rating(self, state, index):
+        self.rating_log.append(state, index)
+
+    def load(self, tester_id):
+        return self.rating_log.load(tester_id)
+
+    def record_result(self, *row):
+        self.results.record(*row)
+
+    def record_telemetry(self, *row):
+        self.results.record_telemetry(*row)
+
+    def ratings(self):
+        return self.results.ratings()
+
+    def close(self):
+        self.rating_log.close()
+
+
+class SqliteBackend:
+    """State shared by every worker process through one SQLite database in WAL mode.
+
+    Allocation runs in an immediate transaction, so two workers can never hand out the
+    same first-pass sheet. Session snapshots are binary rows in `sessions`, and results share
+    the `ratings` table layout of `ResultsStore`. No external service is needed; the
+    database only has to be on a filesystem that supports SQLite locking.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS allocations (
+        sheet_id INTEGER PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS allocations_by_count ON allocations (count, sheet_id);
+    CREATE TABLE IF NOT EXISTS assignments (
+        tester_id TEXT PRIMARY KEY,
+        sheet_id INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS sessions (
+        tester_id TEXT PRIMARY KEY,
+        state BLOB NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, num_sheets: int, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self.results = ResultsStore(db_path)
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+            conn.executemany(
+                "INSERT OR IGNORE INTO allocations (sheet_id) VALUES (?)",
+                ((i,) for i in range(num_sheets)),
+            )
+        self.num_sheets = num_sheets
+        self.retired = frozenset()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def allocate(self, tester_id):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT sheet_id FROM assignments WHERE tester_id = ?", (tester_id,)
+            ).fetchone()
+            if row is None:
+                retired = sorted(self.retired)
+                row = conn.execute(
+                    "SELECT sheet_id FROM allocations WHERE sheet_id < ?"
+                    f" AND sheet_id NOT IN ({', '.join('?' * len(retired))})"
+                    " ORDER BY count, sheet_id LIMIT 1",
+                    (self.num_sheets, *retired),
+                ).fetchone()
+                if row is None:
+                    # Every sheet is retired; there is nothing to assign.
+                    conn.execute("ROLLBACK")
+                    return None
+                conn.execute("UPDATE allocations SET count = count + 1 WHERE sheet_id = ?", row)
+                conn.execute("INSERT INTO assignments VALUES (?, ?)", (tester_id, row[0]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row[0]
+
+    def add_sheets(self, num_sheets):
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO allocations (sheet_id) VALUES (?)",
+                ((i,) for i in range(self.num_sheets, num_sheets)),
+            )
+        self.num_sheets = max(self.num_sheets, num_sheets)
+
+    def retire(self, sheet_ids):
+        # Every worker watches the same sheets, so each one learns about retirements itself.
+        self.retired = self.retired | set(sheet_ids)
+
+    def save_snapshot(self, state):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+            (state["tester_id"], encode(state), time.time()),
+        )
+
+    def append_rating(self, state, index):
+        # Session rows are small enough that rewriting one is as cheap as an append.
+        self.save_snapshot(state)
+
+    def load(self, tester_id):
+        row = self._connection().execute(
+            "SELECT state FROM sessions WHERE tester_id = ?", (tester_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        # Rows written before the binary format hold JSON text.
+        return decode(row[0]) if isinstance(row[0], bytes) else validate(json.loads(row[0]))
+
+    def record_result(self, *row):
+        self.results.record(*row)
+
+    def record_telemetry(self, *row):
+        self.results.record_telemetry(*row)
+
+    def ratings(self):
+        return self.results.ratings()
+
+    def ratings_since(self, seq):
+        return self.results.ratings_since(seq)
+
+    def close(self):
+        pass
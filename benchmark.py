@@ -0,0 +1,164 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+HANDLERS = ("set_tester_id", "submit_options", "go_back", "go_next")
+
+
+def think_time(spec):
+    """Build a think-time sampler from a spec such as `exp:2`, `uniform:1:5`, `lognormal:0.5:0.8` or `const:0`."""
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    samplers = {
+        "const": lambda rng: params[0],
+        "exp": lambda rng: rng.expovariate(1 / params[0]) if params[0] > 0 else 0.0,
+        "uniform": lambda rng: rng.uniform(params[0], params[1]),
+        "lognormal": lambda rng: rng.lognormvariate(params[0], params[1]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown think-time distribution {kind!r}")
+    return samplers[kind]
+
+
+class Recorder:
+    """Thread-safe collection of per-handler latencies in seconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+
+    def timed(self, name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies[name].append(elapsed)
+        return result
+
+    def report(self, wall_time):
+        lines = [f"{'handler':<16}{'calls':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        total = 0
+        for name in HANDLERS:
+            values = sorted(self.latencies.get(name, []))
+            if not values:
+                continue
+            total += len(values)
+            pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+            lines.append(f"{name:<16}{len(values):>8}{pick(0.5):>10.2f}{pick(0.95):>10.2f}"
+                         f"{pick(0.99):>10.2f}{values[-1] * 1000:>10.2f}")
+        lines.append(f"{total} handler calls in {wall_time:.2f}s ({total / wall_time:.1f} calls/s)")
+        return "\n".join(lines)
+
+
+def run_direct(app, tester_id, args, recorder, sleep):
+    """Drive one virtual rater through the MOSApp handlers; return its final state."""
+    rng = random.Random(f"{args.seed}:{tester_id}")
+    labels = list(app.MOS_SCORES)
+    state = app.initialize_state()
+    _, state, *_ = recorder.timed("set_tester_id", app.set_tester_id, tester_id, state)
+    target = len(app._session_sheet(state))
+    if args.items:
+        target = min(target, args.items)
+    while state["index"] < target:
+        sleep(rng)
+        if state["index"] > 0 and rng.random() < args.revisit:
+            state = recorder.timed("go_back", app.go_back, state)[6]
+            state = recorder.timed("go_next", app.go_next, state)[6]
+            continue
+        scores = [rng.choice(labels) for _ in range(3)]
+        state = recorder.timed("submit_options", app.submit_options, *scores, state)[4]
+    return state
+
+
+def run_http(url, tester_id, args, recorder, sleep):
+    """Drive one virtual rater through the Gradio HTTP API of a running server."""
+    from gradio_client import Client
+
+    rng = random.Random(f"{args.seed}:{tester_id}")
+    client = Client(url, verbose=False)
+    labels = ["1 - Bad", "1.5", "2 - Poor", "2.5", "3 - Fair", "3.5", "4 - Good", "4.5", "5 - Excellent"]
+    recorder.timed("set_tester_id", client.predict, tester_id, api_name="/set_tester_id")
+    for index in range(args.items or 30):
+        sleep(rng)
+        if index > 0 and rng.random() < args.revisit:
+            recorder.timed("go_back", client.predict, api_name="/go_back")
+            recorder.timed("go_next", client.predict, api_name="/go_next")
+        scores = [rng.choice(labels) for _ in range(3)]
+        recorder.timed("submit_options", client.predict, *scores, api_name="/submit_options")
+    return None
+
+
+def check_direct(app, states):
+    """Return a list of correctness problems found after a direct run."""
+    problems = []
+    app.writer.flush()
+    sheets = Counter(state["sheet_id"] for state in states.values())
+    first_pass = min(len(states), len(app.catalog))
+    if len(sheets) < first_pass:
+        problems.append(f"only {len(sheets)} distinct sheets for {len(states)} raters")
+    if sheets and max(sheets.values()) - min(sheets.values()) > 1 and len(sheets) == len(app.catalog):
+        problems.append(f"unbalanced sheet assignment: {dict(sheets)}")
+    stored = defaultdict(dict)
+    for tester_id, item, _, _, _, *scores in app.backend.ratings():
+        stored[tester_id][item] = scores
+    for tester_id, state in states.items():
+        saved = app.backend.load(tester_id)
+        expected = [list(s) for s in zip(state["selected_naturalness_MOS"],
+                                          state["selected_intelligibility_MOS"],
+                                          state["selected_similarity_MOS"])]
+        if saved is None or saved["selected_naturalness_MOS"] != state["selected_naturalness_MOS"]:
+            problems.append(f"{tester_id}: saved progress does not match submitted scores")
+        if [stored[tester_id].get(i) for i in range(len(expected))] != expected:
+            problems.append(f"{tester_id}: results store is missing or has wrong scores")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate concurrent raters against MOSApp.")
+    parser.add_argument("--raters", type=int, default=100, help="Number of virtual raters")
+    parser.add_argument("--concurrency", type=int, help="Raters active at once (defaults to --raters)")
+    parser.add_argument("--items", type=int, help="Items each rater submits (defaults to the full sheet, or 30 over HTTP)")
+    parser.add_argument("--think", default="exp:0.05", help="Think time between actions, e.g. exp:2, uniform:1:5, const:0")
+    parser.add_argument("--revisit", type=float, default=0.1, help="Probability of a Back/Next round trip before a submit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dirpath", default="./samples/data", help="Sheets for direct mode")
+    parser.add_argument("--state-db", action="store_true", help="Benchmark the shared SQLite backend (direct mode)")
+    parser.add_argument("--url", help="Benchmark a running server through the Gradio API, e.g. http://localhost:7860/gradio/")
+    args = parser.parse_args()
+
+    sampler = think_time(args.think)
+    sleep = lambda rng: time.sleep(sampler(rng))
+    recorder = Recorder()
+    tester_ids = [f"bench{i}" for i in range(args.raters)]
+
+    if args.url:
+        work = lambda tester_id: run_http(args.url, tester_id, args, recorder, sleep)
+    else:
+        from app import MOSApp
+
+        workdir = tempfile.mkdtemp(prefix="mos-bench-")
+        app = MOSApp(
+            dirpath=args.dirpath,
+            outdir=os.path.join(workdir, "results"),
+            progress_dir=os.path.join(workdir, "progress"),
+            state_db=os.path.join(workdir, "state.db") if args.state_db else None,
+        )
+        work = lambda tester_id: run_direct(app, tester_id, args, recorder, sleep)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency or args.raters) as executor:
+        states = dict(zip(tester_ids, executor.map(work, tester_ids)))
+    wall_time = time.perf_counter() - start
+    print(recorder.report(wall_time))
+
+    if not args.url:
+        problems = check_direct(app, states)
+        print("correctness: " + ("OK" if not problems else f"{len(problems)} problem(s)"))
+        for problem in problems[:20]:
+            print("  " + problem)
+        app.close()
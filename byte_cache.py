@@ -0,0 +1,67 @@
+import os
+import mmap
+import threading
+from collections import OrderedDict
+
+
+class AudioByteCache:
+    """Process-wide LRU cache of audio file contents bounded by a memory budget.
+
+    Entries are keyed by path and invalidated when the file's mtime or size changes.
+    Files of at least `mmap_threshold` bytes are memory-mapped instead of read, so they
+    are served from the OS page cache without a private copy. Files larger than the
+    whole budget are returned but never cached.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, mmap_threshold: int = 8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.mmap_threshold = mmap_threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path):
+        """Return the contents of `path` as bytes (or a read-only mmap for large files)."""
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        data = self._read(path, stat.st_size)
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.size -= old[0][1]
+            if stat.st_size <= self.max_bytes:
+                self._entries[path] = (key, data)
+                self.size += stat.st_size
+                while self.size > self.max_bytes:
+                    _, (evicted_key, _) = self._entries.popitem(last=False)
+                    self.size -= evicted_key[1]
+                    self.evictions += 1
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _read(self, path, size):
+        with open(path, "rb") as f:
+            if size >= self.mmap_threshold:
+                # Evicted maps are closed by the garbage collector once no reader holds them.
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return f.read()
@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class Sheet:
+    """Read-only columnar view of one assignment sheet.
+
+    Each column is a tuple; paths and model names are interned so that sheets sharing
+    the same prompt or system share one string object.
+    """
+
+    __slots__ = ("filepath", "gt", "model", "transcript")
+
+    def __init__(self, filepath, gt, model, transcript):
+        self.filepath = tuple(sys.intern(str(v)) for v in filepath)
+        self.gt = tuple(sys.intern(str(v)) for v in gt)
+        self.model = tuple(sys.intern(str(v)) for v in model)
+        self.transcript = tuple(str(v) for v in transcript)
+
+    @classmethod
+    def from_df(cls, df):
+        return cls(df["filepath"], df["gt"], df["model"], df["transcript"])
+
+    def __len__(self):
+        return len(self.filepath)
+
+
+class CsvSheetSource:
+    """Sheets stored as one CSV file each in a directory, in sorted file name order."""
+
+    def __init__(self, dirpath: str):
+        self.dirpath = dirpath
+        self.names = tuple(sorted(os.listdir(dirpath)))
+
+    def path(self, sheet_id):
+        return os.path.join(self.dirpath, self.names[sheet_id])
+
+    def load(self, sheet_id):
+        return Sheet.from_df(pd.read_csv(self.path(sheet_id)))
+
+    def row_count(self, sheet_id):
+        # Counting lines is much cheaper than parsing the sheet.
+        with open(self.path(sheet_id), "rb") as f:
+            data = f.read()
+        lines = data.count(b"\n") + (0 if data.endswith(b"\n") else 1)
+        return max(lines - 1, 0)
+
+
+class VersionedCsvSource(CsvSheetSource):
+    """A watched directory of CSV sheets whose ids are append-only across reloads.
+
+    Every sheet version is copied to `store_dir/<sheet_id>.csv` when it is first seen and
+    always loaded from that copy, so a session keeps the exact sheet it was given. A new
+    file gets the next id; a changed file retires its old id and gets a new one; a
+    removed file retires its id. The id order is kept in `store_dir/manifest.json`, and
+    a fresh manifest lists the current files in sorted order, so ids match
+    `CsvSheetSource` for an unchanged directory. Refreshes hold an exclusive lock on the
+    manifest, so worker processes sharing `store_dir` agree on every id.
+    """
+
+    def __init__(self, dirpath: str, store_dir: str, settle: float = 2.0):
+        self.dirpath = dirpath
+        self.store_dir = store_dir
+        # Files modified this recently may still be being written; they are picked up later.
+        self.settle = settle
+        self.manifest_path = os.path.join(store_dir, "manifest.json")
+        self.entries = []
+        self.names = ()
+        os.makedirs(store_dir, exist_ok=True)
+        self.refresh()
+
+    def path(self, sheet_id):
+        return os.path.join(self.store_dir, f"{sheet_id}.csv")
+
+    def retired(self):
+        return [sheet_id for sheet_id, entry in enumerate(self.entries) if entry[3]]
+
+    def refresh(self):
+        """Sync ids with the directory; return (added ids, retired ids) new to this process."""
+        import fcntl
+
+        settle = self.settle
+        known = len(self.entries)
+        known_retired = set(self.retired())
+        with open(self.manifest_path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, "r") as f:
+                    entries = json.load(f)["sheets"]
+            else:
+                # The first listing takes every file, so ids follow the sorted file order.
+                settle = 0.0
+            active = {entry[0]: i for i, entry in enumerate(entries) if not entry[3]}
+            current = {}
+            for entry in os.scandir(self.dirpath):
+                if entry.is_file():
+                    stat = entry.stat()
+                    current[entry.name] = [stat.st_mtime_ns, stat.st_size]
+            changed = False
+            for name, sheet_id in active.items():
+                if current.get(name) != entries[sheet_id][1:3]:
+                    entries[sheet_id][3] = True
+                    changed = True
+            for name in sorted(current):
+                sheet_id = active.get(name)
+                if sheet_id is not None and not entries[sheet_id][3]:
+                    continue
+                if time.time() - current[name][0] / 1e9 < settle:
+                    continue
+                if self._freeze(name, current[name], len(entries)):
+                    entries.append([name, *current[name], False])
+                    changed = True
+            if changed:
+                tmp_path = self.manifest_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump({"sheets": entries}, f)
+                os.replace(tmp_path, self.manifest_path)
+        self.entries = entries
+        self.names = tuple(entry[0] for entry in entries)
+        added = list(range(known, len(entries)))
+        retired = [i for i in self.retired() if i not in known_retired]
+        return added, retired
+
+    def _freeze(self, name, stat, sheet_id):
+        """Copy a sheet into the store; False if it changed while being copied."""
+        src = os.path.join(self.dirpath, name)
+        tmp_path = self.path(sheet_id) + ".tmp"
+        shutil.copyfile(src, tmp_path)
+        after = os.stat(src)
+        if [after.st_mtime_ns, after.st_size] != stat:
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, self.path(sheet_id))
+        return True
+
+
+class SampleCatalog:
+    """Process-wide registry of assignment sheets, addressed by sheet id.
+
+    Only the sheet names are listed at construction. A sheet is read from `source` the
+    first time it is accessed, and at most `max_loaded` parsed sheets are kept in
+    memory (least recently used are dropped first); `None` keeps every sheet once parsed.
+    """
+
+    def __init__(self, source, max_loaded: int = None):
+        self.source = source
+        self.max_loaded = max_loaded
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()
+        self._row_counts = {}
+        self._by_files = None
+
+    @classmethod
+    def open(cls, path, max_loaded: int = None, store_dir: str = None):
+        """Open a directory of CSV sheets, or a single-file sheet store.
+
+        With `store_dir`, a directory is opened as a `VersionedCsvSource` that `reload`
+        can pick up changes from.
+        """
+        if os.path.isdir(path):
+            if store_dir is not None:
+                return cls(VersionedCsvSource(path, store_dir), max_loaded=max_loaded)
+            return cls(CsvSheetSource(path), max_loaded=max_loaded)
+        from sheet_store import SqliteSheetSource
+        return cls(SqliteSheetSource(path), max_loaded=max_loaded)
+
+    @property
+    def names(self):
+        return self.source.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def retired(self):
+        """Ids that remain readable for existing sessions but must not be assigned again."""
+        return self.source.retired() if hasattr(self.source, "retired") else []
+
+    def reload(self):
+        """Pick up added, changed and removed sheets; return (added ids, retired ids)."""
+        if not hasattr(self.source, "refresh"):
+            return [], []
+        added, retired = self.source.refresh()
+        if added or retired:
+            self._by_files = None
+        return added, retired
+
+    def watch(self, interval, on_change):
+        """Poll for sheet changes every `interval` seconds on a daemon thread.
+
+        `on_change(added, retired)` is called after each reload that found changes.
+        Returns an Event that stops the thread when set.
+        """
+        stop = threading.Event()
+
+        def poll():
+            while not stop.wait(interval):
+                try:
+                    added, retired = self.reload()
+                    if added or retired:
+                        logger.info("Sheets reloaded: %d added, %d retired", len(added), len(retired))
+                        on_change(added, retired)
+                except Exception:
+                    logger.exception("Reloading sheets failed")
+
+        threading.Thread(target=poll, name="sheet-watcher", daemon=True).start()
+        return stop
+
+    def __getitem__(self, sheet_id):
+        with self._lock:
+            sheet = self._loaded.get(sheet_id)
+            if sheet is not None:
+                self._loaded.move_to_end(sheet_id)
+                return sheet
+        sheet = self.load(sheet_id)
+        with self._lock:
+            self._loaded[sheet_id] = sheet
+            self._row_counts[sheet_id] = len(sheet)
+            if self.max_loaded is not None:
+                while len(self._loaded) > self.max_loaded:
+                    self._loaded.popitem(last=False)
+        return sheet
+
+    def load(self, sheet_id):
+        """Read a sheet from the source without keeping it in the catalog."""
+        return self.source.load(sheet_id)
+
+    def row_count(self, sheet_id):
+        """Return the number of rows in a sheet without necessarily parsing it."""
+        count = self._row_counts.get(sheet_id)
+        if count is None:
+            count = self._row_counts[sheet_id] = self.source.row_count(sheet_id)
+        return count
+
+    def scan(self):
+        """Yield every (sheet_id, sheet) pair without filling the in-memory cache."""
+        for sheet_id in range(len(self)):
+            with self._lock:
+                sheet = self._loaded.get(sheet_id)
+            yield sheet_id, sheet if sheet is not None else self.load(sheet_id)
+
+    def find(self, filepaths):
+        """Return the id of the sheet whose `filepath` column equals `filepaths`, or None."""
+        if self._by_files is None:
+            self._by_files = {sheet.filepath: i for i, sheet in self.scan()}
+        return self._by_files.get(tuple(filepaths))
@@ -0,0 +1,127 @@
+import os
+import csv
+import argparse
+
+import numpy as np
+import pandas as pd
+
+PROMPT_DIR = "prompt"
+
+
+def load_metadata(path):
+    """Load utterance metadata as a DataFrame with `gt_name`, `prompt_name` and `text`.
+
+    Accepts `mos_samples.csv` or the pipe-delimited `test-clean-clipped-3s.txt`
+    (target, prompt, target text, prompt text, clipped prompt text, duration).
+    """
+    if path.endswith(".txt"):
+        df = pd.read_csv(path, sep="|", header=None, quoting=csv.QUOTE_NONE,
+                         usecols=[0, 1, 2], names=["gt_name", "prompt_name", "text"])
+    else:
+        df = pd.read_csv(path)
+    return df.drop_duplicates("gt_name").reset_index(drop=True)
+
+
+def list_systems(audio_root):
+    """Every system directory under `audio_root` except the reference prompts."""
+    return sorted(
+        d for d in os.listdir(audio_root)
+        if d != PROMPT_DIR and os.path.isdir(os.path.join(audio_root, d))
+    )
+
+
+def filter_available(metadata, systems, audio_root):
+    """Keep utterances whose prompt and every system's output exist on disk."""
+    ok = metadata["prompt_name"].map(
+        lambda name: os.path.exists(os.path.join(audio_root, PROMPT_DIR, name))
+    ).to_numpy()
+    for system in systems:
+        available = set(os.listdir(os.path.join(audio_root, system)))
+        ok &= metadata["gt_name"].isin(available).to_numpy()
+    return metadata[ok].reset_index(drop=True)
+
+
+def design(n_utterances, n_systems, sheet_size, ratings, seed=0):
+    """Assign (utterance, system) cells to sheets.
+
+    For every replication, utterances are shuffled and split into groups of about
+    `sheet_size`. Each group yields `n_systems` sheets where the i-th utterance is paired
+    with system (i + shift) % n_systems, which is a cyclic Latin square. As a result:
+    - every (utterance, system) cell appears exactly `ratings` times;
+    - no sheet contains the same utterance twice;
+    - systems are spread evenly within each sheet.
+    Returns (sheet, utterance, system) index arrays with rows shuffled within each sheet.
+    """
+    rng = np.random.default_rng(seed)
+    n_groups = -(-n_utterances // sheet_size)
+    position = np.arange(n_utterances)
+    group = position * n_groups // n_utterances
+    shift = np.arange(n_systems)[:, None]
+    sheets, utterances, systems = [], [], []
+    for r in range(ratings):
+        perm = rng.permutation(n_utterances)
+        base = r * n_systems * n_groups
+        sheets.append((base + shift * n_groups + group).ravel())
+        utterances.append(np.broadcast_to(perm, (n_systems, n_utterances)).ravel())
+        systems.append(((position + shift) % n_systems).ravel())
+    sheet = np.concatenate(sheets)
+    utterance = np.concatenate(utterances)
+    system = np.concatenate(systems)
+    order = np.lexsort((rng.random(len(sheet)), sheet))
+    return sheet[order], utterance[order], system[order]
+
+
+def write_sheets(outdir, metadata, systems, audio_root, sheet, utterance, system):
+    """Write one CSV per sheet, named so that sorted order matches sheet order."""
+    os.makedirs(outdir, exist_ok=True)
+    gt_names = metadata["gt_name"].to_numpy()[utterance]
+    prompts = metadata["prompt_name"].to_numpy()[utterance]
+    texts = metadata["text"].to_numpy()[utterance]
+    models = np.asarray(systems, dtype=object)[system]
+    bounds = np.flatnonzero(np.diff(sheet)) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(sheet)]])
+    width = len(str(len(starts) - 1))
+    for i, (lo, hi) in enumerate(zip(starts, ends)):
+        with open(os.path.join(outdir, f"{i:0{width}d}.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["filepath", "gt", "model", "transcript"])
+            writer.writerows(
+                (f"{audio_root}/{m}/{g}", f"{audio_root}/{PROMPT_DIR}/{p}", m, t)
+                for g, p, m, t in zip(gt_names[lo:hi], prompts[lo:hi], models[lo:hi], texts[lo:hi])
+            )
+    return len(starts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate balanced assignment sheets.")
+    parser.add_argument("outdir", help="Directory to write the sheets into")
+    parser.add_argument("--metadata", default="mos_samples.csv",
+                        help="mos_samples.csv or test-clean-clipped-3s.txt")
+    parser.add_argument("--audio-root", default="samples/audios")
+    parser.add_argument("--systems", nargs="+", help="Systems to include (defaults to every directory under --audio-root)")
+    parser.add_argument("--sheet-size", type=int, default=30, help="Utterances per sheet")
+    parser.add_argument("--ratings", type=int, default=1, help="Ratings per (utterance, system) pair")
+    parser.add_argument("--max-utterances", type=int, help="Use a random subset of this many utterances")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-check-audio", action="store_true",
+                        help="Do not drop utterances whose audio is missing for some system")
+    parser.add_argument("--force", action="store_true", help="Write into a non-empty output directory")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.outdir) and os.listdir(args.outdir) and not args.force:
+        parser.error(f"{args.outdir} is not empty; pass --force to write into it anyway")
+    systems = args.systems or list_systems(args.audio_root)
+    metadata = load_metadata(args.metadata)
+    if not args.no_check_audio:
+        metadata = filter_available(metadata, systems, args.audio_root)
+    if args.max_utterances and len(metadata) > args.max_utterances:
+        metadata = metadata.sample(n=args.max_utterances, random_state=args.seed).reset_index(drop=True)
+    if len(metadata) == 0:
+        parser.error("no utterance has audio for every system")
+
+    sheet_size = min(args.sheet_size, len(metadata))
+    sheet, utterance, system = design(len(metadata), len(systems), sheet_size, args.ratings, seed=args.seed)
+    count = write_sheets(args.outdir, metadata, systems, args.audio_root, sheet, utterance, system)
+    print(f"Wrote {count} sheets: {len(metadata)} utterances x {len(systems)} systems, "
+          f"{args.ratings} rating(s) per pair")
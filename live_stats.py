@@ -0,0 +1,128 @@
+import os
+import json
+import math
+import time
+import threading
+
+from aggregate import METRICS, t_critical
+
+# Scores are half steps from 1 to 5: one histogram bin per step.
+BINS = [1 + i / 2 for i in range(9)]
+
+
+class LiveStats:
+    """Running per-(model, metric) statistics, updated in O(1) per submitted rating.
+
+    Each cell keeps a count, a Welford mean and sum of squared deviations, and a histogram
+    over the nine possible scores. A revised rating is removed (by reversing the Welford
+    update) before its new scores are added. The figures are rebuilt from the stored
+    ratings at startup; `path`, if given, receives a JSON snapshot at most every
+    `persist_interval` seconds for monitoring tools. Ratings added with a `tester_id` are
+    also summed per rater, so `scoreboard` can leave out given raters (e.g. the ones
+    `RaterQuality.flagged` returns) by subtracting their cells.
+    """
+
+    def __init__(self, path: str = None, persist_interval: float = 30.0, writer=None):
+        self.path = path
+        self.persist_interval = persist_interval
+        self.writer = writer
+        self._lock = threading.Lock()
+        self.cells = {}
+        # tester_id -> {(model, metric): cell}
+        self.rater_cells = {}
+        self._last_persist = time.monotonic()
+
+    def _cell(self, model, metric):
+        cell = self.cells.get((model, metric))
+        if cell is None:
+            cell = self.cells[model, metric] = [0, 0.0, 0.0, [0] * len(BINS)]
+        return cell
+
+    def _cells(self, model, metric, tester_id):
+        if tester_id is None:
+            return (self._cell(model, metric),)
+        rater = self.rater_cells.setdefault(tester_id, {})
+        cell = rater.get((model, metric))
+        if cell is None:
+            cell = rater[model, metric] = [0, 0.0, 0.0, [0] * len(BINS)]
+        return self._cell(model, metric), cell
+
+    def add(self, model, scores, tester_id=None):
+        """Add one rating's (natural, intelligibility, similarity) scores."""
+        with self._lock:
+            for metric, score in zip(METRICS, scores):
+                for cell in self._cells(model, metric, tester_id):
+                    cell[0] += 1
+                    delta = score - cell[1]
+                    cell[1] += delta / cell[0]
+                    cell[2] += delta * (score - cell[1])
+                    cell[3][int(round(score * 2)) - 2] += 1
+        self._maybe_persist()
+
+    def remove(self, model, scores, tester_id=None):
+        """Take back scores previously passed to `add`, e.g. when a rating is revised."""
+        with self._lock:
+            for metric, score in zip(METRICS, scores):
+                for cell in self._cells(model, metric, tester_id):
+                    if cell[0] <= 1:
+                        cell[:] = [0, 0.0, 0.0, [0] * len(BINS)]
+                        continue
+                    mean = cell[1]
+                    cell[0] -= 1
+                    cell[1] = (mean * (cell[0] + 1) - score) / cell[0]
+                    cell[2] = max(cell[2] - (score - mean) * (score - cell[1]), 0.0)
+                    cell[3][int(round(score * 2)) - 2] -= 1
+
+    def load(self, ratings):
+        """Rebuild from stored (tester_id, model, natural, intelligibility, similarity) rows."""
+        for tester_id, model, *scores in ratings:
+            self.add(model, scores, tester_id)
+
+    def scoreboard(self, confidence=0.95, exclude=()):
+        """Return one dict per (model, metric) with n, mean, std, CI half-width and histogram.
+
+        Ratings added with a tester id in `exclude` are left out.
+        """
+        with self._lock:
+            cells = {key: (list(cell[:3]), list(cell[3])) for key, cell in self.cells.items()}
+            for tester_id in exclude:
+                for key, (n_b, mean_b, m2_b, histogram_b) in self.rater_cells.get(tester_id, {}).items():
+                    (n, mean, m2), histogram = cells[key]
+                    # The inverse of merging two groups' Welford statistics.
+                    n_a = n - n_b
+                    if n_a <= 0:
+                        cells[key] = ([0, 0.0, 0.0], [0] * len(BINS))
+                        continue
+                    mean_a = (n * mean - n_b * mean_b) / n_a
+                    m2_a = max(m2 - m2_b - (mean_b - mean_a) ** 2 * n_a * n_b / n, 0.0)
+                    cells[key] = ([n_a, mean_a, m2_a], [h - h_b for h, h_b in zip(histogram, histogram_b)])
+        rows = []
+        for (model, metric), ((n, mean, m2), histogram) in sorted(cells.items()):
+            if n == 0:
+                continue
+            std = math.sqrt(m2 / (n - 1)) if n > 1 else None
+            half_width = float(t_critical(n - 1, confidence)) * std / math.sqrt(n) if n > 1 else None
+            rows.append({
+                "model": model, "metric": metric, "n": n, "mean": mean, "std": std,
+                "ci_half_width": half_width, "histogram": dict(zip(map(str, BINS), histogram)),
+            })
+        return rows
+
+    def persist(self):
+        payload = json.dumps({"updated_at": time.time(), "scoreboard": self.scoreboard()})
+        if self.writer is None:
+            self._write(payload)
+        else:
+            self.writer.submit(self._write, payload, key=self.path)
+
+    def _maybe_persist(self):
+        if self.path is None or time.monotonic() - self._last_persist < self.persist_interval:
+            return
+        self._last_persist = time.monotonic()
+        self.persist()
+
+    def _write(self, payload):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,250 @@
+import os
+import json
+import wave
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from validate_audio import IEEE_FLOAT, read_wav_header
+
+logger = logging.getLogger(__name__)
+
+# ITU-R BS.1770 K-weighting as two biquads, given by analog parameters so the filter
+# can be built at any sample rate; at 48 kHz this reproduces the coefficients in the spec
+# (parameters from B. De Man, "Evaluation of implementations of the EBU R128 loudness
+# measurement", AES 2018).
+SHELF = {"fc": 1681.974450955533, "gain_db": 3.999843853973347, "q": 0.7071752369554196}
+HIGH_PASS = {"fc": 38.13547087602444, "q": 0.5003270373238773}
+
+BLOCK = 0.4
+OVERLAP = 0.75
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+
+def k_weighting(rate):
+    """Return the (b, a) coefficient pairs of the two K-weighting stages at `rate`."""
+    k = np.tan(np.pi * SHELF["fc"] / rate)
+    q = SHELF["q"]
+    vh = 10 ** (SHELF["gain_db"] / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (
+        np.array([vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k]) / a0,
+        np.array([a0, 2 * (k * k - 1), 1 - k / q + k * k]) / a0,
+    )
+    k = np.tan(np.pi * HIGH_PASS["fc"] / rate)
+    q = HIGH_PASS["q"]
+    a0 = 1 + k / q + k * k
+    high_pass = (
+        np.array([1.0, -2.0, 1.0]),
+        np.array([a0, 2 * (k * k - 1), 1 - k / q + k * k]) / a0,
+    )
+    return [shelf, high_pass]
+
+
+def k_weight(samples, rate):
+    """Apply K-weighting to `samples` (frames x channels) in the frequency domain."""
+    # Padding lets the filters' impulse response decay instead of wrapping around.
+    n = len(samples) + rate // 2
+    n_fft = 1 << (n - 1).bit_length()
+    z = np.exp(-1j * np.pi * np.arange(n_fft // 2 + 1) / (n_fft // 2))
+    response = np.ones_like(z)
+    for b, a in k_weighting(rate):
+        response *= (b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)
+    spectrum = np.fft.rfft(samples, n=n_fft, axis=0) * response[:, None]
+    return np.fft.irfft(spectrum, n=n_fft, axis=0)[:len(samples)]
+
+
+def integrated_loudness(samples, rate):
+    """Return the gated integrated loudness of `samples` (frames x channels) in LUFS."""
+    weighted = k_weight(samples, rate)
+    block = int(round(BLOCK * rate))
+    step = int(round(BLOCK * (1 - OVERLAP) * rate))
+    # Mean square per 400 ms block and channel, from one cumulative sum.
+    energy = np.concatenate([np.zeros((1, weighted.shape[1])), np.cumsum(weighted ** 2, axis=0)])
+    if len(weighted) < block:
+        starts, block = np.array([0]), len(weighted)
+    else:
+        starts = np.arange(0, len(weighted) - block + 1, step)
+    # Mono, stereo and the front channels of surround formats all have weight 1.
+    power = ((energy[starts + block] - energy[starts]) / max(block, 1)).sum(axis=1)
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(power)
+    gated = power[block_loudness > ABSOLUTE_GATE]
+    if len(gated) == 0:
+        return -np.inf
+    threshold = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = power[(block_loudness > ABSOLUTE_GATE) & (block_loudness > threshold)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def read_wav(path):
+    """Return (samples as float64 frames x channels in [-1, 1], rate, sample width).
+
+    Reads PCM (8 to 32 bit), IEEE-float (32 or 64 bit) and extensible WAV files.
+    """
+    with open(path, "rb") as f:
+        header = read_wav_header(f)
+        data = f.read(header["data_size"])
+    rate, channels, width = header["rate"], header["channels"], header["width"]
+    data = data[:len(data) - len(data) % (width * channels)]
+    if header["format"] == IEEE_FLOAT:
+        samples = np.frombuffer(data, dtype="<f4" if width == 4 else "<f8").astype(np.float64)
+    elif width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float64) - 128) / 128
+    elif width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        values = raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16)
+        samples = np.where(values >= 1 << 23, values - (1 << 24), values) / float(1 << 23)
+    else:
+        dtype = {2: "<i2", 4: "<i4"}[width]
+        samples = np.frombuffer(data, dtype=dtype) / float(np.iinfo(dtype).max + 1)
+    return samples.reshape(-1, channels), rate, width
+
+
+def write_wav(path, samples, rate):
+    """Write `samples` as 16-bit PCM."""
+    pcm = np.clip(np.round(samples * 32768), -32768, 32767).astype("<i2")
+    with wave.open(path, "wb") as w:
+        w.setnchannels(samples.shape[1])
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+
+
+def normalize_file(src, dst, target, max_peak_db):
+    """Write a copy of `src` at `target` LUFS to `dst`; return (loudness, applied gain in dB).
+
+    The gain is lowered if the sample peak would exceed `max_peak_db` dBFS, so such files
+    end up quieter than the target rather than clipped. Silent files are copied unchanged.
+    """
+    samples, rate, _ = read_wav(src)
+    loudness = integrated_loudness(samples, rate)
+    gain_db = target - loudness if np.isfinite(loudness) else 0.0
+    peak = np.abs(samples).max() if samples.size else 0.0
+    if peak > 0:
+        gain_db = min(gain_db, max_peak_db - 20 * np.log10(peak))
+    tmp_path = f"{dst}.{os.getpid()}.tmp"
+    write_wav(tmp_path, samples * 10 ** (gain_db / 20), rate)
+    os.replace(tmp_path, dst)
+    return loudness, float(gain_db)
+
+
+class LoudnessNormalizer:
+    """Content-addressed cache of loudness-normalized copies of the sample audio.
+
+    Integrated loudness follows ITU-R BS.1770 (K-weighting, 400 ms blocks, absolute and
+    relative gating). Copies are stored under `cache_dir` by the SHA-256 of the source
+    content and target level, and files are processed in parallel across processes.
+    `index.json` maps each source path to [mtime_ns, size, hash, loudness, gain] so
+    restarts and `resolve` need no re-hashing.
+    """
+
+    def __init__(self, cache_dir: str, target: float = -26.0, max_peak_db: float = -1.0, workers: int = None):
+        self.cache_dir = cache_dir
+        self.target = target
+        self.max_peak_db = max_peak_db
+        self.workers = workers or os.cpu_count()
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        self._index = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self._index = json.load(f)
+
+    def content_hash(self, path):
+        digest = hashlib.sha256(f"{self.target}:{self.max_peak_db}:".encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def cached_path(self, content_hash):
+        return os.path.join(self.cache_dir, content_hash[:2], content_hash + ".wav")
+
+    def normalize(self, paths):
+        """Normalize every distinct existing path that is not cached yet; persist the index.
+
+        Returns a list of (path, error) for the files that could not be read; those keep
+        being served as they are, and each one is logged.
+        """
+        failed = []
+        jobs = {}
+        for path in dict.fromkeys(paths):
+            if not os.path.exists(path) or self.resolve(path) != path:
+                continue
+            stat = os.stat(path)
+            content_hash = self.content_hash(path)
+            dst = self.cached_path(content_hash)
+            if os.path.exists(dst):
+                with self._lock:
+                    self._index[path] = [stat.st_mtime_ns, stat.st_size, content_hash, None, None]
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            jobs[path] = (stat, content_hash, dst)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                path: executor.submit(normalize_file, path, dst, self.target, self.max_peak_db)
+                for path, (_, _, dst) in jobs.items()
+            }
+            for path, future in futures.items():
+                stat, content_hash, _ = jobs[path]
+                try:
+                    loudness, gain_db = future.result()
+                except (ValueError, OSError) as e:
+                    logger.warning("Not normalizing %s: %s", path, e)
+                    failed.append((path, str(e)))
+                    continue
+                with self._lock:
+                    self._index[path] = [stat.st_mtime_ns, stat.st_size, content_hash, loudness, gain_db]
+        with self._lock:
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, self.index_path)
+        return failed
+
+    def resolve(self, path):
+        """Return the normalized copy of `path` if it is cached and current, otherwise `path`."""
+        entry = self._index.get(path)
+        if entry is None:
+            return path
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return path
+        if entry[:2] != [stat.st_mtime_ns, stat.st_size]:
+            return path
+        dst = self.cached_path(entry[2])
+        return dst if os.path.exists(dst) else path
+
+
+if __name__ == "__main__":
+    from catalog import SampleCatalog
+
+    parser = argparse.ArgumentParser(description="Write loudness-normalized copies of every audio file referenced by the sheets.")
+    parser.add_argument("dirpath", help="Directory of assignment CSV files, or a sheet store")
+    parser.add_argument("--cache-dir", default="./cache/loudness")
+    parser.add_argument("--target", type=float, default=-26.0, help="Target integrated loudness in LUFS")
+    parser.add_argument("--max-peak", type=float, default=-1.0, help="Highest sample peak allowed after gain, in dBFS")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    paths = []
+    for _, sheet in SampleCatalog.open(args.dirpath).scan():
+        paths.extend(sheet.filepath + sheet.gt)
+    normalizer = LoudnessNormalizer(args.cache_dir, target=args.target, max_peak_db=args.max_peak, workers=args.workers)
+    logging.basicConfig(format="%(levelname)s %(message)s")
+    failed = normalizer.normalize(paths)
+    paths = set(paths)
+    normalized = sum(normalizer.resolve(p) != p for p in paths)
+    print(f"{normalized}/{len(paths)} files normalized to {args.target} LUFS in {args.cache_dir}")
+    if failed:
+        print(f"{len(failed)} files could not be read and are served as they are")
+        raise SystemExit(1)
@@ -0,0 +1,153 @@
+import json
+import time
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond cache hits to slow disks.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FAMILIES = {
+    "handler": "Time spent in a Gradio event handler.",
+    "step": "Time spent in one step of a handler or of a write-behind task.",
+}
+
+COUNTERS = {
+    "assignments": "Sheets handed out to new testers.",
+    "ratings": "Ratings submitted, including revisions.",
+    "completed_sheets": "Sessions that reached the end of their sheet.",
+}
+
+
+class Metrics:
+    """Opt-in, in-process timings and counters, rendered in the Prometheus text format.
+
+    Timings are histograms per `(family, name)`, where the family is "handler" for Gradio
+    event handlers and "step" for their sub-steps. A session counts as active from
+    `set_tester_id` until it finishes or has been idle for `active_window` seconds.
+    When disabled, every method is a cheap no-op. Values are per process.
+    """
+
+    def __init__(self, enabled: bool = True, active_window: float = 900.0):
+        self.enabled = enabled
+        self.active_window = active_window
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.gauges = {}
+        self._last_seen = {}
+
+    def observe(self, family, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get((family, name))
+            if histogram is None:
+                histogram = self.histograms[family, name] = [[0] * (len(BUCKETS) + 1), 0, 0.0]
+            histogram[0][bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+
+    @contextmanager
+    def timer(self, family, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(family, name, time.perf_counter() - start)
+
+    def wrap(self, family, name, fn):
+        """Return `fn` timed under `(family, name)`; `fn` itself when disabled."""
+        if not self.enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with self.timer(family, name):
+                return fn(*args, **kwargs)
+        return timed
+
+    def inc(self, counter, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[counter] += amount
+
+    def gauge(self, name, fn, help_text=""):
+        """Register a gauge whose value is read from `fn()` at render time."""
+        self.gauges[name] = (fn, help_text)
+
+    def touch(self, tester_id):
+        if self.enabled:
+            with self._lock:
+                self._last_seen[tester_id] = time.monotonic()
+
+    def finish(self, tester_id):
+        if self.enabled:
+            with self._lock:
+                self._last_seen.pop(tester_id, None)
+
+    def active_sessions(self):
+        cutoff = time.monotonic() - self.active_window
+        with self._lock:
+            for tester_id in [t for t, seen in self._last_seen.items() if seen < cutoff]:
+                del self._last_seen[tester_id]
+            return len(self._last_seen)
+
+    def snapshot(self):
+        """Return every metric as a JSON-serializable dict."""
+        with self._lock:
+            timings = {
+                f"{family}:{name}": {
+                    "count": count,
+                    "sum": total,
+                    "mean": total / count if count else 0.0,
+                    "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], buckets)),
+                }
+                for (family, name), (buckets, count, total) in sorted(self.histograms.items())
+            }
+            counters = dict(self.counters)
+        gauges = {name: fn() for name, (fn, _) in self.gauges.items()}
+        gauges["active_sessions"] = self.active_sessions()
+        return {"timings": timings, "counters": counters, "gauges": gauges}
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = dict(self.counters)
+        for family, help_text in FAMILIES.items():
+            metric = f"mos_{family}_seconds"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+            for (hist_family, name), (buckets, count, total) in histograms:
+                if hist_family != family:
+                    continue
+                label = f'{family}="{name}"'
+                cumulative = 0
+                for bound, n in zip([str(b) for b in BUCKETS] + ["+Inf"], buckets):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum{{{label}}} {total}")
+                lines.append(f"{metric}_count{{{label}}} {count}")
+        for name, help_text in COUNTERS.items():
+            lines += [f"# HELP mos_{name}_total {help_text}", f"# TYPE mos_{name}_total counter",
+                      f"mos_{name}_total {counters[name]}"]
+        gauges = {"active_sessions": (self.active_sessions, "Sessions seen recently that have not finished.")}
+        gauges.update(self.gauges)
+        for name, (fn, help_text) in gauges.items():
+            lines += [f"# HELP mos_{name} {help_text}", f"# TYPE mos_{name} gauge", f"mos_{name} {fn()}"]
+        return "\n".join(lines) + "\n"
+
+
+def timed_handler(fn):
+    """Time a MOSApp event handler under its own name in `self.metrics`."""
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.timer("handler", fn.__name__):
+            return fn(self, *args, **kwargs)
+    return wrapper
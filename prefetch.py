@@ -0,0 +1,72 @@
+import os
+import html
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from gradio import processing_utils
+
+
+class Prefetcher:
+    """Warms upcoming audio files in the background while the current item is being rated.
+
+    Server-side, each file is loaded into the shared `byte_cache` and, once `cache_dir`
+    is known, staged into Gradio's file cache from memory so the player's response no
+    longer waits on the original storage. Client-side, `hints` renders
+    `<link rel="prefetch">` tags pointing at the staged copies, so the browser downloads
+    them before the rater moves on. Files are staged once per process, which covers the
+    reference prompts shared across sheets. With an `audio_route`, nothing is staged and
+    the hints point at the route's URLs instead.
+    """
+
+    def __init__(self, byte_cache, depth: int = 3, workers: int = 2, cache_dir: str = None,
+                 audio_route=None):
+        self.byte_cache = byte_cache
+        self.depth = depth
+        self.cache_dir = cache_dir
+        self.audio_route = audio_route
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._warmed = {}
+        self._pending = set()
+
+    def warm(self, paths):
+        """Schedule every path that has not been warmed yet."""
+        with self._lock:
+            paths = [p for p in paths if p and p not in self._warmed and p not in self._pending]
+            self._pending.update(paths)
+        for path in paths:
+            self._executor.submit(self._warm_one, path)
+
+    def staged(self, path):
+        """Return the copy of `path` staged in Gradio's cache (or its route URL), or None."""
+        return self._warmed.get(path)
+
+    def hints(self, paths):
+        """Return preload tags for the paths that already have a cached copy."""
+        tags = []
+        for path in paths:
+            cached = self._warmed.get(path)
+            if cached:
+                href = cached if self.audio_route else "gradio_api/file=" + urllib.parse.quote(cached, safe="/")
+                tags.append(f'<link rel="prefetch" as="audio" href="{html.escape(href)}">')
+        return "\n".join(tags)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _warm_one(self, path):
+        cached = None
+        try:
+            data = self.byte_cache.get(path)
+            if self.audio_route is not None:
+                cached = self.audio_route.url(path)
+            elif self.cache_dir is not None:
+                cached = processing_utils.save_bytes_to_cache(
+                    data, os.path.basename(path), cache_dir=self.cache_dir
+                )
+        except OSError:
+            pass
+        with self._lock:
+            self._pending.discard(path)
+            self._warmed[path] = cached
@@ -0,0 +1,164 @@
+import threading
+
+import numpy as np
+
+DIMENSIONS = ("natural", "intelligibility", "similarity")
+
+
+def _value(x):
+    """Plain float for JSON output, with undefined statistics as None."""
+    return None if np.isnan(x) else float(x)
+
+
+class RaterQuality:
+    """Inter-rater reliability and per-rater quality, maintained as ratings arrive.
+
+    Items are audio files (`filepath`). Each item keeps its rating count and per-dimension
+    sum and sum of squares, and the study keeps running totals of those over items with at
+    least two ratings. Krippendorff's alpha (interval metric) and the one-way ICC(1) are
+    closed-form functions of these totals, so a new or revised rating costs O(1).
+
+    Individual ratings are kept as a sparse rater-by-item matrix in coordinate form, from
+    which `raters()` computes every rater's correlation with the leave-one-out consensus
+    of the other raters and straight-lining flags in one vectorized pass.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rater_ids = {}
+        self.item_ids = {}
+        self.item_n = []
+        self.item_s = []
+        self.item_q = []
+        # Coordinate form of the rater-by-item matrix.
+        self.cells = {}
+        self.rating_rater = []
+        self.rating_item = []
+        self.rating_scores = []
+        # Totals over items with >= 2 ratings: count, sum, sum of squares,
+        # sum of (n q - s^2) / (n - 1), sum of s^2 / n, number of items, sum of n^2.
+        self.totals = {"n": 0, "s": np.zeros(3), "q": np.zeros(3), "w": np.zeros(3),
+                       "r": np.zeros(3), "items": 0, "nn": 0}
+
+    def add(self, tester_id, item, scores):
+        """Add (or, for a rater's second rating of `item`, replace) one rating."""
+        scores = [float(score) for score in scores]
+        with self._lock:
+            rater = self.rater_ids.setdefault(tester_id, len(self.rater_ids))
+            if item not in self.item_ids:
+                self.item_ids[item] = len(self.item_n)
+                self.item_n.append(0)
+                self.item_s.append([0.0] * 3)
+                self.item_q.append([0.0] * 3)
+            item = self.item_ids[item]
+            index = self.cells.get((rater, item))
+            self._contribute(item, -1)
+            if index is None:
+                self.cells[rater, item] = len(self.rating_scores)
+                self.rating_rater.append(rater)
+                self.rating_item.append(item)
+                self.rating_scores.append(scores)
+                self.item_n[item] += 1
+            else:
+                old = self.rating_scores[index]
+                for d in range(3):
+                    self.item_s[item][d] -= old[d]
+                    self.item_q[item][d] -= old[d] * old[d]
+                self.rating_scores[index] = scores
+            for d in range(3):
+                self.item_s[item][d] += scores[d]
+                self.item_q[item][d] += scores[d] * scores[d]
+            self._contribute(item, 1)
+
+    def load(self, ratings):
+        """Add stored (tester_id, filepath, natural, intelligibility, similarity) rows."""
+        for tester_id, item, *scores in ratings:
+            self.add(tester_id, item, scores)
+
+    def _contribute(self, item, sign):
+        n = self.item_n[item]
+        if n < 2:
+            return
+        s, q = np.array(self.item_s[item]), np.array(self.item_q[item])
+        t = self.totals
+        t["n"] += sign * n
+        t["s"] += sign * s
+        t["q"] += sign * q
+        t["w"] += sign * (n * q - s * s) / (n - 1)
+        t["r"] += sign * s * s / n
+        t["items"] += sign
+        t["nn"] += sign * n * n
+
+    def reliability(self):
+        """Return {dimension: {"alpha": ..., "icc1": ...}} over items with >= 2 ratings.
+
+        Values are None until there is enough data to define them.
+        """
+        with self._lock:
+            t = {key: np.copy(value) for key, value in self.totals.items()}
+        n, k = float(t["n"]), float(t["items"])
+        result = {}
+        for d, name in enumerate(DIMENSIONS):
+            alpha = icc = float("nan")
+            expected = n * t["q"][d] - t["s"][d] ** 2
+            if n > 1 and expected > 0:
+                alpha = 1 - (n - 1) * t["w"][d] / expected
+            if k > 1 and n > k:
+                msb = (t["r"][d] - t["s"][d] ** 2 / n) / (k - 1)
+                msw = (t["q"][d] - t["r"][d]) / (n - k)
+                n0 = (n - t["nn"] / n) / (k - 1)
+                if msb + (n0 - 1) * msw > 0:
+                    icc = (msb - msw) / (msb + (n0 - 1) * msw)
+            result[name] = {"alpha": _value(alpha), "icc1": _value(icc)}
+        return result
+
+    def raters(self, min_items=10):
+        """Return one dict per rater with its item count, consensus correlations and flags.
+
+        `consensus_r` is the Pearson correlation, per dimension, between the rater's scores
+        and the mean of the other raters on the same items (items nobody else rated are
+        skipped; None when undefined). A rater is `straight_lined` when they gave one single
+        score per dimension across at least `min_items` items.
+        """
+        with self._lock:
+            if not self.rating_scores:
+                return []
+            rater = np.array(self.rating_rater)
+            item = np.array(self.rating_item)
+            x = np.array(self.rating_scores)
+            n = np.array(self.item_n)[item]
+            s = np.array(self.item_s)[item]
+            names = list(self.rater_ids)
+        n_raters = len(names)
+        counts = np.bincount(rater, minlength=n_raters)
+        shared = n >= 2
+        y = (s[shared] - x[shared]) / (n[shared] - 1)[:, None]
+        xs, rs = x[shared], rater[shared]
+        m = np.bincount(rs, minlength=n_raters)[:, None].astype(float)
+        sums = {name: np.stack([np.bincount(rs, weights=v[:, d], minlength=n_raters) for d in range(3)], axis=1)
+                for name, v in (("x", xs), ("y", y), ("xx", xs * xs), ("yy", y * y), ("xy", xs * y))}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = m * sums["xy"] - sums["x"] * sums["y"]
+            var = (m * sums["xx"] - sums["x"] ** 2) * (m * sums["yy"] - sums["y"] ** 2)
+            corr = np.where(var > 0, cov / np.sqrt(var), np.nan)
+        low = np.full((n_raters, 3), np.inf)
+        high = np.full((n_raters, 3), -np.inf)
+        np.minimum.at(low, rater, x)
+        np.maximum.at(high, rater, x)
+        straight = (counts >= min_items) & (low == high).all(axis=1)
+        return [
+            {"tester_id": names[i], "n_items": int(counts[i]), "n_shared": int(m[i, 0]),
+             "consensus_r": dict(zip(DIMENSIONS, map(_value, corr[i]))),
+             "straight_lined": bool(straight[i])}
+            for i in range(n_raters)
+        ]
+
+    def flagged(self, min_items=10, min_consensus=0.2):
+        """Return the ids of raters that straight-lined, or whose mean consensus correlation
+        over at least `min_items` shared items is below `min_consensus`."""
+        flagged = set()
+        for row in self.raters(min_items):
+            r = [v for v in row["consensus_r"].values() if v is not None]
+            if row["straight_lined"] or (row["n_shared"] >= min_items and r and np.mean(r) < min_consensus):
+                flagged.add(row["tester_id"])
+        return flagged
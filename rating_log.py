@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from state_codec import encode, decode, validate
+
+
+class RatingLog:
+    """Per-tester progress storage: a snapshot file plus an append-only log of rating events.
+
+    Each submit appends one small event line to `<tester_id>.log` instead of rewriting
+    the whole `<tester_id>.state` snapshot (see `state_codec`). The log is folded into
+    the snapshot every `compact_every` events, and fsyncs are batched every
+    `fsync_every` events or `fsync_interval` seconds, whichever comes first. JSON
+    snapshots from earlier versions are still read and replaced by the next snapshot.
+
+    At most `max_open` logs are kept open, least recently used first out. A background
+    thread fsyncs and closes every open log each `fsync_interval` seconds, so the last
+    events of an idle or abandoned session reach the disk and release their descriptor.
+    """
+
+    def __init__(self, progress_dir: str, compact_every: int = 50, fsync_every: int = 8,
+                 fsync_interval: float = 1.0, max_open: int = 64):
+        self.progress_dir = progress_dir
+        self.compact_every = compact_every
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._handles = OrderedDict()
+        self._since_compaction = {}
+        self._unsynced = {}
+        self._last_sync = {}
+        os.makedirs(progress_dir, exist_ok=True)
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name="rating-log-fsync", daemon=True)
+        self._flusher.start()
+
+    def snapshot_path(self, tester_id):
+        return os.path.join(self.progress_dir, f"{tester_id}.state")
+
+    def legacy_path(self, tester_id):
+        return os.path.join(self.progress_dir, f"{tester_id}.json")
+
+    def log_path(self, tester_id):
+        return os.path.join(self.progress_dir, f"{tester_id}.log")
+
+    def write_snapshot(self, state):
+        """Atomically replace the snapshot with `state` and truncate the event log."""
+        tester_id = state["tester_id"]
+        with self._lock:
+            self._close(tester_id)
+            path = self.snapshot_path(tester_id)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(encode(state))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            if os.path.exists(self.legacy_path(tester_id)):
+                os.remove(self.legacy_path(tester_id))
+            # A crash before this truncation only leaves already-applied events behind,
+            # and replaying them is idempotent.
+            open(self.log_path(tester_id), "w").close()
+            self._since_compaction[tester_id] = 0
+
+    def append(self, state, index):
+        """Append the scores stored at `index` in `state` as a single rating event."""
+        tester_id = state["tester_id"]
+        event = {
+            "index": index,
+            "naturalness": state["selected_naturalness_MOS"][index],
+            "intelligibility": state["selected_intelligibility_MOS"][index],
+            "similarity": state["selected_similarity_MOS"][index],
+            "timestamp": time.time(),
+        }
+        if state.get("items"):
+            event["item"] = state["items"][index]
+        with self._lock:
+            f = self._handles.get(tester_id)
+            if f is None:
+                while len(self._handles) >= self.max_open:
+                    self._close(next(iter(self._handles)))
+                f = self._handles[tester_id] = open(self.log_path(tester_id), "a")
+                self._last_sync[tester_id] = time.monotonic()
+            else:
+                self._handles.move_to_end(tester_id)
+            f.write(json.dumps(event) + "\n")
+            f.flush()
+            self._unsynced[tester_id] = self._unsynced.get(tester_id, 0) + 1
+            if (self._unsynced[tester_id] >= self.fsync_every
+                    or time.monotonic() - self._last_sync[tester_id] >= self.fsync_interval):
+                self._sync(tester_id)
+            self._since_compaction[tester_id] = self._since_compaction.get(tester_id, 0) + 1
+            compact = self._since_compaction[tester_id] >= self.compact_every
+        if compact:
+            self.write_snapshot(state)
+
+    def load(self, tester_id):
+        """Return the snapshot for `tester_id` with its logged events replayed, or None."""
+        path = self.snapshot_path(tester_id)
+        legacy_path = self.legacy_path(tester_id)
+        if not os.path.exists(path) and not os.path.exists(legacy_path):
+            return None
+        with self._lock:
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    state = decode(f.read())
+            else:
+                with open(legacy_path, "r") as f:
+                    state = validate(json.load(f))
+            replayed = 0
+            log_path = self.log_path(tester_id)
+            if os.path.exists(log_path):
+                with open(log_path, "r") as f:
+                    for line in f:
+                        try:
+                            event = json.loads(line)
+                        except json.JSONDecodeError:
+                            # Torn write from a crash: everything after it is unusable.
+                            break
+                        if self._apply(state, event):
+                            replayed += 1
+            self._since_compaction[tester_id] = replayed
+        return state
+
+    def flush(self):
+        """Fsync and close every open log; the next append reopens it."""
+        with self._lock:
+            for tester_id in list(self._handles):
+                self._close(tester_id)
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            for tester_id in list(self._handles):
+                self._close(tester_id)
+
+    @staticmethod
+    def _apply(state, event):
+        index = event["index"]
+        scores = (
+            ("selected_naturalness_MOS", event["naturalness"]),
+            ("selected_intelligibility_MOS", event["intelligibility"]),
+            ("selected_similarity_MOS", event["similarity"]),
+        )
+        submitted_count = len(state["selected_naturalness_MOS"])
+        if index < submitted_count:
+            for key, value in scores:
+                state[key][index] = value
+        elif index == submitted_count:
+            for key, value in scores:
+                state[key].append(value)
+        else:
+            return False
+        if "item" in event:
+            items = state.setdefault("items", [])
+            if index < len(items):
+                items[index] = event["item"]
+            else:
+                items.append(event["item"])
+        state["index"] = index + 1
+        return True
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.fsync_interval):
+            self.flush()
+
+    def _sync(self, tester_id):
+        f = self._handles.get(tester_id)
+        if f is not None and self._unsynced.get(tester_id):
+            os.fsync(f.fileno())
+        self._unsynced[tester_id] = 0
+        self._last_sync[tester_id] = time.monotonic()
+
+    def _close(self, tester_id):
+        f = self._handles.pop(tester_id, None)
+        if f is not None:
+            if self._unsynced.get(tester_id):
+                os.fsync(f.fileno())
+            f.close()
+        self._unsynced.pop(tester_id, None)
+        self._last_sync.pop(tester_id, None)
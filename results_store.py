@@ -0,0 +1,181 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import argparse
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ratings (
+    tester_id TEXT NOT NULL,
+    item INTEGER NOT NULL,
+    sheet_id INTEGER NOT NULL,
+    filepath TEXT NOT NULL,
+    model TEXT NOT NULL,
+    natural REAL NOT NULL,
+    intelligibility REAL NOT NULL,
+    similarity REAL NOT NULL,
+    submitted_at REAL NOT NULL,
+    seq INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tester_id, item)
+);
+CREATE TABLE IF NOT EXISTS rating_sequence (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS telemetry (
+    tester_id TEXT NOT NULL,
+    item INTEGER NOT NULL,
+    filepath TEXT NOT NULL,
+    submit_ms INTEGER,
+    synth_first_play_ms INTEGER,
+    synth_plays INTEGER NOT NULL,
+    synth_listened_ms INTEGER NOT NULL,
+    ref_first_play_ms INTEGER,
+    ref_plays INTEGER NOT NULL,
+    ref_listened_ms INTEGER NOT NULL,
+    events TEXT NOT NULL,
+    submitted_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS telemetry_by_item ON telemetry (tester_id, item);
+"""
+
+CSV_HEADER = ["filepath", "model", "Natural-MOS", "Intelligibility-MOS", "Similarity-MOS"]
+
+TELEMETRY_COLUMNS = [
+    "submit_ms", "synth_first_play_ms", "synth_plays", "synth_listened_ms",
+    "ref_first_play_ms", "ref_plays", "ref_listened_ms",
+]
+
+
+class ResultsStore:
+    """Shared store of submitted ratings, one row per (tester, item), in SQLite WAL mode.
+
+    Every submit upserts a single row, so partial work is visible to readers while the
+    study is running and concurrent writers from several threads or processes are safe.
+    Each upsert also takes the next number from `rating_sequence` in the same transaction,
+    so `seq` grows in commit order and `ratings_since` never misses a late commit.
+    Per-tester CSV files in the original layout are produced on demand by `export_csv`.
+    Listening telemetry is appended to `telemetry`, one row per submit, so revisits of an
+    item keep their own row.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+        self._add_sequence()
+
+    def _add_sequence(self):
+        """Number the ratings of stores created before `seq` existed, in the order they were written."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if "seq" not in [column[1] for column in conn.execute("PRAGMA table_info(ratings)")]:
+                conn.execute("ALTER TABLE ratings ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE ratings SET seq = rowid")
+                conn.execute("DROP INDEX IF EXISTS ratings_by_time")
+            conn.execute("CREATE INDEX IF NOT EXISTS ratings_by_seq ON ratings (seq)")
+            conn.execute(
+                "INSERT OR IGNORE INTO rating_sequence VALUES (0, (SELECT COALESCE(MAX(seq), 0) FROM ratings))"
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, tester_id, sheet_id, item, filepath, model, natural, intelligibility, similarity):
+        """Insert or overwrite the scores a tester gave to one item of their sheet."""
+        with self._connection() as conn:
+            # The UPDATE takes the write lock, so no later number can commit before this one.
+            conn.execute("UPDATE rating_sequence SET seq = seq + 1")
+            conn.execute(
+                "INSERT OR REPLACE INTO ratings (tester_id, item, sheet_id, filepath, model, natural,"
+                " intelligibility, similarity, submitted_at, seq)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, (SELECT seq FROM rating_sequence))",
+                (tester_id, item, sheet_id, filepath, model, natural, intelligibility, similarity,
+                 time.time()),
+            )
+
+    def record_telemetry(self, tester_id, item, filepath, summary, events):
+        """Append the listening summary (see `telemetry.summarize`) of one submit."""
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO telemetry VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (tester_id, item, filepath, *(summary[c] for c in TELEMETRY_COLUMNS),
+                 json.dumps(events), time.time()),
+            )
+
+    def telemetry(self, tester_id=None):
+        """Return (tester_id, item, filepath, *TELEMETRY_COLUMNS) rows in submission order."""
+        query = f"SELECT tester_id, item, filepath, {', '.join(TELEMETRY_COLUMNS)} FROM telemetry"
+        if tester_id is None:
+            return self._connection().execute(query + " ORDER BY rowid").fetchall()
+        return self._connection().execute(query + " WHERE tester_id = ? ORDER BY rowid", (tester_id,)).fetchall()
+
+    def export_telemetry(self, csv_path):
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["tester_id", "item", "filepath"] + TELEMETRY_COLUMNS)
+            writer.writerows(self.telemetry())
+
+    def testers(self):
+        rows = self._connection().execute("SELECT DISTINCT tester_id FROM ratings ORDER BY tester_id")
+        return [tester_id for tester_id, in rows]
+
+    def ratings(self, tester_id=None):
+        """Return (tester_id, item, sheet_id, filepath, model, natural, intelligibility, similarity) rows."""
+        query = ("SELECT tester_id, item, sheet_id, filepath, model, natural, intelligibility, similarity"
+                 " FROM ratings")
+        if tester_id is None:
+            return self._connection().execute(query + " ORDER BY tester_id, item").fetchall()
+        return self._connection().execute(query + " WHERE tester_id = ? ORDER BY item", (tester_id,)).fetchall()
+
+    def ratings_since(self, seq):
+        """Return (tester_id, item, filepath, model, natural, intelligibility, similarity, seq)
+        rows written after sequence number `seq`, in the order they were committed."""
+        return self._connection().execute(
+            "SELECT tester_id, item, filepath, model, natural, intelligibility, similarity, seq"
+            " FROM ratings WHERE seq > ? ORDER BY seq",
+            (seq,),
+        ).fetchall()
+
+    def export_csv(self, tester_id, csv_path):
+        """Write one tester's ratings in the per-tester CSV layout."""
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            for row in self.ratings(tester_id):
+                writer.writerow(row[3:])
+
+    def export_all(self, outdir):
+        """Write `<tester_id>.csv` into `outdir` for every tester in the store."""
+        os.makedirs(outdir, exist_ok=True)
+        testers = self.testers()
+        for tester_id in testers:
+            self.export_csv(tester_id, os.path.join(outdir, f"{tester_id}.csv"))
+        return testers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export per-tester result CSVs from a results store.")
+    parser.add_argument("outdir", help="Results directory containing results.db, e.g. results/20250101")
+    parser.add_argument("--csv-dir", help="Where to write the CSV files (defaults to outdir)")
+    parser.add_argument("--telemetry", action="store_true", help="Also write listening telemetry to _telemetry.csv")
+    args = parser.parse_args()
+    store = ResultsStore(os.path.join(args.outdir, "results.db"))
+    exported = store.export_all(args.csv_dir or args.outdir)
+    print(f"Exported {len(exported)} testers")
+    if args.telemetry:
+        # The underscore keeps this clear of the per-tester files.
+        store.export_telemetry(os.path.join(args.csv_dir or args.outdir, "_telemetry.csv"))
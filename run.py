@@ -1,26 +1,124 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 import gradio as gr
 import re
 import os
 import json
 import pandas as pd
+from contextlib import asynccontextmanager
 from datetime import datetime
 from display_text import DESCRIPTIONS
 
-from app import MOSApp
+from app import MOSApp, SharedResources
 
-app = FastAPI()
+current_date = datetime.now().strftime("%Y%m%d")
+# Audio bytes, the /audio route and the prefetcher are shared by every study in this process.
+# Players load audio from the /audio route below, with Range, ETag and caching headers.
+# Give every worker the same MOS_AUDIO_SECRET so audio URLs work on all of them and across restarts.
+shared = SharedResources(audio_route="/audio", audio_secret=os.environ.get("MOS_AUDIO_SECRET"))
+
+
+def load_studies(config_path):
+    """Build one MOSApp per entry of a JSON file mapping study names to MOSApp arguments.
+
+    `outdir` and `progress_dir` default to `results/<date>/<study>` and
+    `progress/<date>/<study>`, so studies never share assignment, progress or results.
+    """
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    studies = {}
+    for name, options in config.items():
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+            raise ValueError(f"Invalid study name {name!r}: use letters, digits, '-' and '_'")
+        options = {
+            "outdir": f"./results/{current_date}/{name}",
+            "progress_dir": f"./progress/{current_date}/{name}",
+            **options,
+        }
+        studies[name] = MOSApp(shared=shared, **options)
+    return studies
+
+
+# Set MOS_STUDIES to a JSON config to serve several studies, each at /gradio/<study>.
+if os.environ.get("MOS_STUDIES"):
+    studies = load_studies(os.environ["MOS_STUDIES"])
+else:
+    studies = {"": MOSApp(
+            dirpath="./samples/data",   # change as you need
+            outdir=f"./results/{current_date}",
+            progress_dir=f"./progress/{current_date}",
+            audio_cache_dir="./cache/audio",
+            audio_validation_cache="./cache/audio_validation.json",
+            loudness_cache_dir="./cache/loudness",
+            # Pick up added, changed and removed sheets every 10 seconds without a restart.
+            reload_interval=10,
+            # Set MOS_STATE_DB to share allocation, progress and results between workers.
+            state_db=os.environ.get("MOS_STATE_DB"),
+            # Set MOS_METRICS=1 to collect timings and counters, served at /metrics.
+            metrics=os.environ.get("MOS_METRICS") == "1",
+            shared=shared,
+        )}
+
+
+def get_study(name):
+    # The monitoring routes below take ?study=<name>; it may be left out with a single study.
+    if name is None and len(studies) == 1:
+        return next(iter(studies.values()))
+    if name not in studies:
+        raise HTTPException(status_code=404, detail=f"Unknown study {name!r}")
+    return studies[name]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Drain queued progress and result writes before the worker exits.
+    for name, mos_app in studies.items():
+        mos_app.close()
+        if os.environ.get("MOS_METRICS_DUMP"):
+            root, ext = os.path.splitext(os.environ["MOS_METRICS_DUMP"])
+            mos_app.metrics.dump(f"{root}-{name}{ext}" if name else root + ext)
+    shared.close()
+
+app = FastAPI(lifespan=lifespan)
+shared.audio_route.mount(app)
 
 @app.get('/')
 async def root():
-    return 'Gradio app is running at /gradio', 200
+    if list(studies) == [""]:
+        return 'Gradio app is running at /gradio', 200
+    return {"studies": {name: f"/gradio/{name}" for name in studies}}
 
-current_date = datetime.now().strftime("%Y%m%d")
-app = MOSApp(
-        dirpath="./samples/data",   # change as you need
-        outdir=f"./results/{current_date}",
-        progress_dir=f"./progress/{current_date}",
-    )
-demo = app.create_interface()
-
-app = gr.mount_gradio_app(app, demo, path='/gradio')
\ No newline at end of file
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics(study: str = None):
+    # Prometheus text exposition format; values are for this worker process only.
+    mos_app = get_study(study)
+    return PlainTextResponse(mos_app.metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get('/scoreboard')
+def scoreboard(study: str = None, exclude_flagged: bool = False):
+    # Read-only running MOS per model and metric. With MOS_STATE_DB, this includes the
+    # ratings submitted through every worker. `?exclude_flagged=true` leaves out the
+    # raters listed as flagged at /raters.
+    mos_app = get_study(study)
+    mos_app.sync_ratings()
+    exclude = mos_app.rater_quality.flagged() if exclude_flagged else ()
+    return {"scoreboard": mos_app.live_stats.scoreboard(exclude=exclude)}
+
+@app.get('/raters')
+def raters(study: str = None):
+    mos_app = get_study(study)
+    mos_app.sync_ratings()
+    quality = mos_app.rater_quality
+    return {
+        "reliability": quality.reliability(),
+        "flagged": sorted(quality.flagged()),
+        "raters": quality.raters(),
+    }
+
+@app.get('/metrics.json')
+async def metrics_json(study: str = None):
+    return get_study(study).metrics.snapshot()
+
+for name, mos_app in studies.items():
+    app = gr.mount_gradio_app(app, mos_app.create_interface(), path=f"/gradio/{name}".rstrip("/"))
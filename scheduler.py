@@ -0,0 +1,201 @@
+import os
+import math
+import heapq
+import random
+import time
+import threading
+from collections import deque
+
+from aggregate import t_critical
+from state_codec import SCORE_KEYS
+
+
+class SessionSheet:
+    """The items an adaptive session has been served so far, viewed like a catalog sheet.
+
+    Columns only cover the items handed out yet, while `len()` is the session's target
+    length, so the handlers know when the session is finished.
+    """
+
+    __slots__ = ("filepath", "gt", "model", "transcript", "length")
+
+    def __init__(self, rows, length):
+        self.filepath, self.gt, self.model, self.transcript = (tuple(c) for c in zip(*rows)) if rows else ((),) * 4
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+
+class AdaptiveScheduler:
+    """Live priority index that routes raters to the items that need ratings most.
+
+    Items are the distinct `filepath`s across all sheets of the catalog. With
+    `policy="count"`, the item with the fewest ratings (including ones handed out but not
+    rated yet) goes first. With `policy="ci"`, items with fewer than two ratings go first,
+    then the widest 95% confidence interval across the three MOS dimensions. A rater
+    never gets two items with the same utterance. A hand-out that is not rated within
+    `pending_ttl` seconds (an abandoned session) stops counting for its item. An item is
+    handed out while at least one sheet that is not retired lists it.
+    """
+
+    def __init__(self, catalog, policy: str = "count", seed: int = 0, pending_ttl: float = 900.0):
+        if policy not in ("count", "ci"):
+            raise ValueError(f"Unknown scheduling policy {policy!r}")
+        self.policy = policy
+        self.pending_ttl = pending_ttl
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self.rows = []
+        self.utterances = []
+        self.ids = {}
+        # Per item, the (time, sequence number) of each hand-out not rated yet, oldest first;
+        # `_handouts` holds all of them in hand-out order for expiry.
+        self.pending = []
+        self._handouts = deque()
+        self._sequence = 0
+        self.count = []
+        # Welford running mean and sum of squared deviations per item and dimension.
+        self.mean = []
+        self.m2 = []
+        self._version = []
+        self._heap = []
+        # Per item, the number of active sheets listing it; per sheet id, its items.
+        self.active = []
+        self._sheet_items = {}
+        retired = set(catalog.retired())
+        for sheet_id, sheet in catalog.scan():
+            if sheet_id not in retired:
+                self.add_sheet(sheet_id, sheet)
+
+    def add_sheet(self, sheet_id, sheet):
+        """Make the items of `sheet` available for scheduling.
+
+        A row whose file is already known replaces that item's reference, model and
+        transcript, so a corrected sheet takes effect; the item keeps its ratings.
+        """
+        with self._lock:
+            if sheet_id in self._sheet_items:
+                return
+            items = self._sheet_items[sheet_id] = []
+            for row in zip(sheet.filepath, sheet.gt, sheet.model, sheet.transcript):
+                filepath = row[0]
+                item = self.ids.get(filepath)
+                if item is None:
+                    item = self.ids[filepath] = len(self.rows)
+                    self.rows.append(row)
+                    self.utterances.append(os.path.basename(filepath))
+                    self.pending.append(deque())
+                    self.count.append(0)
+                    self.mean.append([0.0] * len(SCORE_KEYS))
+                    self.m2.append([0.0] * len(SCORE_KEYS))
+                    self._version.append(0)
+                    self.active.append(0)
+                self.rows[item] = row
+                items.append(item)
+                self.active[item] += 1
+                if self.active[item] == 1:
+                    self._push(item)
+
+    def retire_sheet(self, sheet_id):
+        """Stop handing out the items that no active sheet lists once `sheet_id` is retired."""
+        with self._lock:
+            for item in self._sheet_items.pop(sheet_id, ()):
+                self.active[item] -= 1
+
+    def sheet(self, items, length):
+        return SessionSheet([self.rows[item] for item in items], length)
+
+    def next_item(self, exclude):
+        """Hand out the highest-priority item whose utterance is not in `exclude` items, or None."""
+        excluded = {self.utterances[item] for item in exclude}
+        skipped = []
+        chosen = None
+        with self._lock:
+            self._expire()
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                item, version = entry[-2], entry[-1]
+                if version != self._version[item] or not self.active[item]:
+                    # Outdated, or retired until a sheet lists the item again.
+                    continue
+                if self.utterances[item] in excluded:
+                    skipped.append(entry)
+                    continue
+                chosen = item
+                break
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+            if chosen is not None:
+                self._sequence += 1
+                handout = (time.monotonic(), self._sequence)
+                self.pending[chosen].append(handout)
+                self._handouts.append(handout + (chosen,))
+                self._push(chosen)
+        return chosen
+
+    def record(self, item, scores, handed_out=True):
+        """Add one rating; `handed_out` marks it as answering an item from `next_item`."""
+        with self._lock:
+            if handed_out and self.pending[item]:
+                self.pending[item].popleft()
+            self.count[item] += 1
+            n = self.count[item]
+            for d, score in enumerate(scores):
+                delta = score - self.mean[item][d]
+                self.mean[item][d] += delta / n
+                self.m2[item][d] += delta * (score - self.mean[item][d])
+            self._push(item)
+
+    def remove(self, item, scores):
+        """Take back scores previously passed to `record`, e.g. when a rating is revised."""
+        with self._lock:
+            n = self.count[item]
+            if n <= 1:
+                self.count[item] = 0
+                self.mean[item] = [0.0] * len(SCORE_KEYS)
+                self.m2[item] = [0.0] * len(SCORE_KEYS)
+            else:
+                self.count[item] = n - 1
+                for d, score in enumerate(scores):
+                    mean = self.mean[item][d]
+                    self.mean[item][d] = (mean * n - score) / (n - 1)
+                    self.m2[item][d] = max(self.m2[item][d] - (score - mean) * (score - self.mean[item][d]), 0.0)
+            self._push(item)
+
+    def load(self, ratings):
+        """Rebuild the statistics from stored (filepath, natural, intelligibility, similarity) rows."""
+        for filepath, *scores in ratings:
+            item = self.ids.get(filepath)
+            if item is not None:
+                self.record(item, scores, handed_out=False)
+
+    def ci_width(self, item):
+        n = self.count[item]
+        if n < 2:
+            return math.inf
+        sd = max(math.sqrt(m2 / (n - 1)) for m2 in self.m2[item])
+        return float(t_critical(n - 1)) * sd / math.sqrt(n)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.pending_ttl
+        while self._handouts and self._handouts[0][0] < cutoff:
+            handout_time, sequence, item = self._handouts.popleft()
+            # Rated hand-outs were already taken off the item's queue, oldest first.
+            if self.pending[item] and self.pending[item][0] == (handout_time, sequence):
+                self.pending[item].popleft()
+                self._push(item)
+
+    def _entry(self, item):
+        load = self.count[item] + len(self.pending[item])
+        if self.policy == "count":
+            key = (load,)
+        elif self.count[item] < 2:
+            key = (0, load)
+        else:
+            key = (1, -self.ci_width(item))
+        return key + (self._random.random(), item, self._version[item])
+
+    def _push(self, item):
+        self._version[item] += 1
+        heapq.heappush(self._heap, self._entry(item))
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import argparse
+import threading
+
+from catalog import Sheet, CsvSheetSource
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    sheet_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    row_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS paths (
+    path_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS models (
+    model_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS samples (
+    sheet_id INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    filepath_id INTEGER NOT NULL REFERENCES paths(path_id),
+    gt_id INTEGER NOT NULL REFERENCES paths(path_id),
+    model_id INTEGER NOT NULL REFERENCES models(model_id),
+    transcript TEXT NOT NULL,
+    PRIMARY KEY (sheet_id, row)
+) WITHOUT ROWID;
+"""
+
+
+class SqliteSheetSource:
+    """Sheets stored in a single SQLite file, read one sheet at a time.
+
+    Paths and model names are dictionary-encoded in their own tables, and rows are
+    clustered by (sheet_id, row), so loading a sheet is a single index range scan.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        rows = self._connection().execute(
+            "SELECT name, row_count FROM sheets ORDER BY sheet_id"
+        ).fetchall()
+        self.names = tuple(name for name, _ in rows)
+        self._row_counts = tuple(count for _, count in rows)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            uri = f"file:{os.path.abspath(self.db_path)}?mode=ro"
+            conn = self._local.conn = sqlite3.connect(uri, uri=True)
+        return conn
+
+    def load(self, sheet_id):
+        rows = self._connection().execute(
+            """
+            SELECT f.path, g.path, m.name, s.transcript
+            FROM samples s
+            JOIN paths f ON f.path_id = s.filepath_id
+            JOIN paths g ON g.path_id = s.gt_id
+            JOIN models m ON m.model_id = s.model_id
+            WHERE s.sheet_id = ?
+            ORDER BY s.row
+            """,
+            (sheet_id,),
+        ).fetchall()
+        return Sheet(*zip(*rows)) if rows else Sheet((), (), (), ())
+
+    def row_count(self, sheet_id):
+        return self._row_counts[sheet_id]
+
+
+def import_csv_dir(dirpath, db_path):
+    """Convert a directory of CSV sheets into a single sheet store, keeping sheet ids."""
+    source = CsvSheetSource(dirpath)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    path_ids = {}
+    model_ids = {}
+
+    def encode(table, ids, value):
+        if value not in ids:
+            ids[value] = len(ids)
+            conn.execute(f"INSERT INTO {table} VALUES (?, ?)", (ids[value], value))
+        return ids[value]
+
+    with conn:
+        for sheet_id, name in enumerate(source.names):
+            sheet = source.load(sheet_id)
+            conn.execute("INSERT INTO sheets VALUES (?, ?, ?)", (sheet_id, name, len(sheet)))
+            conn.executemany(
+                "INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        sheet_id,
+                        row,
+                        encode("paths", path_ids, sheet.filepath[row]),
+                        encode("paths", path_ids, sheet.gt[row]),
+                        encode("models", model_ids, sheet.model[row]),
+                        sheet.transcript[row],
+                    )
+                    for row in range(len(sheet))
+                ],
+            )
+    conn.execute("VACUUM")
+    conn.close()
+    return len(source.names)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a directory of CSV sheets into a single sheet store.")
+    parser.add_argument("dirpath", help="Directory of assignment CSV files")
+    parser.add_argument("db_path", help="Output SQLite file, e.g. study.db")
+    args = parser.parse_args()
+    count = import_csv_dir(args.dirpath, args.db_path)
+    print(f"Imported {count} sheets into {args.db_path}")
@@ -0,0 +1,147 @@
+import os
+import json
+import zlib
+import struct
+import argparse
+
+SCORE_KEYS = ("selected_naturalness_MOS", "selected_intelligibility_MOS", "selected_similarity_MOS")
+
+MAGIC = b"MOSS"
+VERSION = 1
+NO_SHEET = 0xFFFFFFFF
+# magic, version, index, sheet id, tester id length, number of scores, number of items
+HEADER = struct.Struct("<4sBIIHII")
+CRC = struct.Struct("<I")
+
+
+class StateFormatError(ValueError):
+    """Raised when stored session state is corrupt, truncated or of an unknown version."""
+
+
+def score_byte(score):
+    """Scores are half steps from 1 to 5, stored as `score * 2` in one byte."""
+    doubled = score * 2
+    if doubled != int(doubled) or not 2 <= doubled <= 10:
+        raise StateFormatError(f"Score {score!r} is not a half step between 1 and 5")
+    return int(doubled)
+
+
+def encode(state):
+    """Serialize a session state to the compact binary format.
+
+    Layout (little endian): the header above, the UTF-8 tester id, one byte per score for
+    each of the three dimensions, one uint32 per scheduled item, and a CRC-32 of everything
+    before it.
+    """
+    scores = [state[key] for key in SCORE_KEYS]
+    n_scores = len(scores[0])
+    if any(len(column) != n_scores for column in scores):
+        raise StateFormatError("Score lists have different lengths")
+    tester_id = state["tester_id"].encode("utf-8")
+    items = state.get("items") or []
+    sheet_id = state.get("sheet_id")
+    body = b"".join([
+        HEADER.pack(MAGIC, VERSION, state["index"], NO_SHEET if sheet_id is None else sheet_id,
+                    len(tester_id), n_scores, len(items)),
+        tester_id,
+        *(bytes(score_byte(score) for score in column) for column in scores),
+        struct.pack(f"<{len(items)}I", *items),
+    ])
+    return body + CRC.pack(zlib.crc32(body))
+
+
+def decode(data):
+    """Parse and validate bytes produced by `encode`; return the state dict."""
+    if len(data) < HEADER.size + CRC.size or data[:4] != MAGIC:
+        raise StateFormatError("Not a session state file")
+    magic, version, index, sheet_id, id_length, n_scores, n_items = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise StateFormatError(f"Unsupported state version {version}")
+    expected = HEADER.size + id_length + 3 * n_scores + 4 * n_items + CRC.size
+    if len(data) != expected:
+        raise StateFormatError(f"State is {len(data)} bytes, expected {expected}")
+    if CRC.unpack_from(data, len(data) - CRC.size)[0] != zlib.crc32(data[:-CRC.size]):
+        raise StateFormatError("State checksum mismatch")
+    offset = HEADER.size
+    state = {"index": index, "tester_id": data[offset:offset + id_length].decode("utf-8")}
+    offset += id_length
+    for key in SCORE_KEYS:
+        column = data[offset:offset + n_scores]
+        if any(not 2 <= b <= 10 for b in column):
+            raise StateFormatError(f"Out of range score in {key}")
+        state[key] = [b / 2 for b in column]
+        offset += n_scores
+    state["sheet_id"] = None if sheet_id == NO_SHEET else sheet_id
+    state["items"] = list(struct.unpack_from(f"<{n_items}I", data, offset))
+    if index > n_scores:
+        raise StateFormatError(f"Index {index} is past the {n_scores} submitted scores")
+    return state
+
+
+def validate(state):
+    """Check a state loaded from JSON and return it; raise StateFormatError if it is malformed."""
+    try:
+        lengths = {len(state[key]) for key in SCORE_KEYS}
+        if len(lengths) != 1:
+            raise StateFormatError("Score lists have different lengths")
+        for key in SCORE_KEYS:
+            for score in state[key]:
+                score_byte(score)
+        if not isinstance(state["index"], int) or not 0 <= state["index"] <= lengths.pop():
+            raise StateFormatError(f"Invalid index {state['index']!r}")
+        if not isinstance(state["tester_id"], str):
+            raise StateFormatError("Missing tester id")
+    except (KeyError, TypeError) as e:
+        raise StateFormatError(f"Malformed state: {e!r}") from None
+    return state
+
+
+def migrate(progress_dir, resolve_sheet=None):
+    """Convert every `<tester_id>.json` in `progress_dir` to `<tester_id>.state`.
+
+    States saved before sheet ids existed need `resolve_sheet(current_files)` to find
+    theirs. Returns (converted, skipped) lists of tester ids; a JSON file is removed only
+    after its binary replacement is in place.
+    """
+    converted, skipped = [], []
+    for name in sorted(os.listdir(progress_dir)):
+        tester_id, ext = os.path.splitext(name)
+        if ext != ".json" or tester_id.startswith("_"):
+            continue
+        path = os.path.join(progress_dir, name)
+        try:
+            with open(path, "r") as f:
+                state = validate(json.load(f))
+            if "sheet_id" not in state:
+                state["sheet_id"] = resolve_sheet(state["current_files"]) if resolve_sheet else None
+                if state["sheet_id"] is None:
+                    raise StateFormatError("No sheet id and no matching sheet")
+            data = encode(state)
+        except (ValueError, KeyError) as e:
+            skipped.append((tester_id, str(e)))
+            continue
+        state_path = os.path.join(progress_dir, tester_id + ".state")
+        with open(state_path + ".tmp", "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(state_path + ".tmp", state_path)
+        os.remove(path)
+        converted.append(tester_id)
+    return converted, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSON progress files to the binary state format.")
+    parser.add_argument("progress_dir", help="Progress directory, e.g. progress/20250101")
+    parser.add_argument("--sheets", help="Sheets directory, needed for states saved before sheet ids existed")
+    args = parser.parse_args()
+
+    resolve_sheet = None
+    if args.sheets:
+        from catalog import SampleCatalog
+        resolve_sheet = SampleCatalog.open(args.sheets).find
+    converted, skipped = migrate(args.progress_dir, resolve_sheet)
+    for tester_id, reason in skipped:
+        print(f"skipped {tester_id}: {reason}")
+    print(f"{len(converted)} converted, {len(skipped)} skipped")
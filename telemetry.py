@@ -0,0 +1,67 @@
+import json
+
+# Players tracked on the rating page, as named in the client-side events.
+PLAYERS = ("synth", "ref")
+# Upper bound on events kept per item, so a misbehaving client cannot bloat the store.
+MAX_EVENTS = 500
+
+# Runs once on page load. Events are buffered in the page and handed to the server in one
+# batch with the next submit, so playback adds no requests of its own.
+SETUP_JS = """
+() => {
+    const t = window.mosTelemetry = {start: performance.now(), events: []};
+    t.record = (player, kind) => {
+        if (t.events.length < %d) t.events.push([player, kind, Math.round(performance.now() - t.start)]);
+    };
+    t.reset = () => { t.start = performance.now(); t.events = []; };
+    t.take = () => {
+        const batch = JSON.stringify({elapsed: Math.round(performance.now() - t.start), events: t.events});
+        t.reset();
+        return batch;
+    };
+}
+""" % MAX_EVENTS
+
+# Replaces the last input of the submit event (the hidden telemetry textbox) with the batch.
+TAKE_JS = "(...args) => [...args.slice(0, -1), window.mosTelemetry ? window.mosTelemetry.take() : '']"
+# Starts a fresh item timer when the displayed item changes without a submit.
+RESET_JS = "(...args) => { if (window.mosTelemetry) window.mosTelemetry.reset(); return args; }"
+
+
+def record_js(player, kind):
+    return f"() => {{ if (window.mosTelemetry) window.mosTelemetry.record('{player}', '{kind}'); }}"
+
+
+def summarize(payload):
+    """Reduce a client batch to per-item listening figures; return (summary, events).
+
+    `summary` holds the time from display to submit, and for each player the time to first
+    play, the number of plays and the total time spent playing, all in milliseconds (time
+    to first play is None if the player was never started). A missing or malformed batch
+    yields an all-empty summary rather than failing the submit.
+    """
+    try:
+        data = json.loads(payload) if payload else {}
+        elapsed = int(data.get("elapsed", 0))
+        events = [
+            [player, kind, int(t)] for player, kind, t in data.get("events", [])[:MAX_EVENTS]
+            if player in PLAYERS
+        ]
+    except (ValueError, TypeError, AttributeError):
+        elapsed, events = 0, []
+    summary = {"submit_ms": elapsed or None}
+    started = {}
+    for player in PLAYERS:
+        summary.update({f"{player}_first_play_ms": None, f"{player}_plays": 0, f"{player}_listened_ms": 0})
+    for player, kind, t in sorted(events, key=lambda event: event[2]):
+        if kind == "play":
+            summary[f"{player}_plays"] += 1
+            if summary[f"{player}_first_play_ms"] is None:
+                summary[f"{player}_first_play_ms"] = t
+            started.setdefault(player, t)
+        elif kind in ("pause", "stop") and player in started:
+            summary[f"{player}_listened_ms"] += t - started.pop(player)
+    # Still playing when the rater submitted.
+    for player, t in started.items():
+        summary[f"{player}_listened_ms"] += max(elapsed - t, 0)
+    return summary, events
@@ -0,0 +1,101 @@
+import os
+
+from rating_log import RatingLog
+from state_codec import SCORE_KEYS
+
+
+def make_state(tester_id="t1", scores=()):
+    state = {"tester_id": tester_id, "sheet_id": 3, "index": len(scores), "items": []}
+    for d, key in enumerate(SCORE_KEYS):
+        state[key] = [s[d] for s in scores]
+    return state
+
+
+def submit(log, state, index, scores):
+    for key, score in zip(SCORE_KEYS, scores):
+        if index < len(state[key]):
+            state[key][index] = score
+        else:
+            state[key].append(score)
+    state["index"] = index + 1
+    log.append(state, index)
+
+
+def test_load_replays_logged_ratings(tmp_path):
+    log = RatingLog(str(tmp_path), compact_every=100)
+    state = make_state()
+    log.write_snapshot(state)
+    submit(log, state, 0, (3, 4, 5))
+    submit(log, state, 1, (1, 1.5, 2))
+    log.close()
+
+    loaded = RatingLog(str(tmp_path)).load("t1")
+    assert loaded["index"] == 2
+    assert loaded["selected_naturalness_MOS"] == [3, 1]
+    assert loaded["selected_similarity_MOS"] == [5, 2]
+
+
+def test_load_applies_revisions(tmp_path):
+    log = RatingLog(str(tmp_path), compact_every=100)
+    state = make_state()
+    log.write_snapshot(state)
+    submit(log, state, 0, (3, 3, 3))
+    submit(log, state, 1, (4, 4, 4))
+    submit(log, state, 0, (5, 2, 1))
+    log.close()
+
+    loaded = RatingLog(str(tmp_path)).load("t1")
+    assert loaded["selected_naturalness_MOS"] == [5, 4]
+    assert loaded["selected_intelligibility_MOS"] == [2, 4]
+    assert loaded["selected_similarity_MOS"] == [1, 4]
+    # The revision moved the position back to the item after the revised one.
+    assert loaded["index"] == 1
+
+
+def test_load_stops_at_torn_line(tmp_path):
+    log = RatingLog(str(tmp_path), compact_every=100)
+    state = make_state()
+    log.write_snapshot(state)
+    submit(log, state, 0, (3, 3, 3))
+    submit(log, state, 1, (4, 4, 4))
+    log.close()
+    path = log.log_path("t1")
+    with open(path, "rb") as f:
+        data = f.read()
+    # Cut the last event in half, as a crash in the middle of a write would.
+    with open(path, "wb") as f:
+        f.write(data[:len(data) - 10])
+
+    loaded = RatingLog(str(tmp_path)).load("t1")
+    assert loaded["selected_naturalness_MOS"] == [3]
+    assert loaded["index"] == 1
+
+
+def test_compaction_folds_log_into_snapshot(tmp_path):
+    log = RatingLog(str(tmp_path), compact_every=2)
+    state = make_state()
+    log.write_snapshot(state)
+    submit(log, state, 0, (3, 3, 3))
+    submit(log, state, 1, (4, 4, 4))
+    log.close()
+
+    assert os.path.getsize(log.log_path("t1")) == 0
+    loaded = RatingLog(str(tmp_path)).load("t1")
+    assert loaded["selected_naturalness_MOS"] == [3, 4]
+
+
+def test_open_logs_are_bounded(tmp_path):
+    log = RatingLog(str(tmp_path), max_open=4, fsync_interval=60)
+    for i in range(20):
+        state = make_state(f"t{i}")
+        log.write_snapshot(state)
+        submit(log, state, 0, (3, 3, 3))
+    assert len(log._handles) == 4
+    log.flush()
+    assert not log._handles
+    assert RatingLog(str(tmp_path)).load("t0")["selected_naturalness_MOS"] == [3]
+    log.close()
+
+
+def test_missing_tester_loads_none(tmp_path):
+    assert RatingLog(str(tmp_path)).load("nobody") is None
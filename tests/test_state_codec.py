@@ -0,0 +1,74 @@
+import zlib
+
+import pytest
+
+from state_codec import CRC, HEADER, StateFormatError, decode, encode, validate
+
+
+def make_state(**overrides):
+    state = {
+        "tester_id": "rater-ä1",
+        "sheet_id": 7,
+        "index": 2,
+        "selected_naturalness_MOS": [1, 4.5, 5],
+        "selected_intelligibility_MOS": [2, 3, 3.5],
+        "selected_similarity_MOS": [5, 5, 1.5],
+        "items": [10, 20, 30],
+    }
+    state.update(overrides)
+    return state
+
+
+def test_round_trip():
+    state = make_state()
+    assert decode(encode(state)) == state
+
+
+def test_round_trip_without_sheet_or_items():
+    state = make_state(sheet_id=None, items=[], index=0, selected_naturalness_MOS=[],
+                       selected_intelligibility_MOS=[], selected_similarity_MOS=[])
+    assert decode(encode(state)) == state
+
+
+def test_flipped_byte_fails_checksum():
+    data = bytearray(encode(make_state()))
+    data[HEADER.size + 2] ^= 0x01
+    with pytest.raises(StateFormatError, match="checksum"):
+        decode(bytes(data))
+
+
+@pytest.mark.parametrize("cut", [1, 5, 20])
+def test_truncated_input(cut):
+    with pytest.raises(StateFormatError):
+        decode(encode(make_state())[:-cut])
+
+
+def test_wrong_magic():
+    with pytest.raises(StateFormatError):
+        decode(b"JUNK" + encode(make_state())[4:])
+
+
+def test_unknown_version():
+    data = bytearray(encode(make_state()))
+    data[4] = 99
+    body = bytes(data[:-CRC.size])
+    with pytest.raises(StateFormatError, match="version"):
+        decode(body + CRC.pack(zlib.crc32(body)))
+
+
+def test_out_of_range_score_with_valid_checksum():
+    data = bytearray(encode(make_state()))
+    data[HEADER.size + len("rater-ä1".encode())] = 11
+    body = bytes(data[:-CRC.size])
+    with pytest.raises(StateFormatError, match="score"):
+        decode(body + CRC.pack(zlib.crc32(body)))
+
+
+def test_encode_rejects_scores_off_the_scale():
+    with pytest.raises(StateFormatError):
+        encode(make_state(selected_naturalness_MOS=[1, 4.25, 5]))
+
+
+def test_validate_rejects_index_past_scores():
+    with pytest.raises(StateFormatError):
+        validate(make_state(index=4))
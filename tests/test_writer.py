@@ -0,0 +1,117 @@
+import threading
+
+from writer import WriteBehindQueue
+
+
+def test_tasks_run_in_submission_order():
+    queue = WriteBehindQueue()
+    out = []
+    for i in range(50):
+        queue.submit(out.append, i)
+    queue.flush()
+    assert out == list(range(50))
+    queue.close()
+
+
+def test_keyed_task_is_replaced_in_place():
+    queue = WriteBehindQueue()
+    gate = threading.Event()
+    out = []
+    queue.submit(gate.wait)
+    queue.submit(out.append, "a1", key="a")
+    queue.submit(out.append, "b", key="b")
+    queue.submit(out.append, "a2", key="a")
+    gate.set()
+    queue.flush()
+    # The replacement keeps the first task's place and only the latest arguments run.
+    assert out == ["a2", "b"]
+    queue.close()
+
+
+def test_flush_tag_waits_for_replaced_task_only():
+    queue = WriteBehindQueue()
+    gate = threading.Event()
+    release = threading.Event()
+    out = []
+    queue.submit(out.append, "snapshot-1", key="snap", tag="t1")
+    queue.submit(gate.wait)
+    queue.submit(out.append, "other", tag="t2")
+    queue.submit(out.append, "snapshot-2", key="snap", tag="t1")
+
+    def flush_t1():
+        queue.flush(tag="t1")
+        release.set()
+
+    threading.Thread(target=flush_t1).start()
+    # t1's only pending task sits before the blocked one, so its flush returns.
+    assert release.wait(2)
+    assert out == ["snapshot-2"]
+    assert not queue.flush(tag="t2", timeout=0.05)
+    gate.set()
+    assert queue.flush(tag="t2", timeout=2)
+    assert out == ["snapshot-2", "other"]
+    queue.close()
+
+
+def test_flush_unknown_tag_returns_immediately():
+    queue = WriteBehindQueue()
+    assert queue.flush(tag="nobody", timeout=0.01)
+    queue.close()
+
+
+class Flaky:
+    """Fails with `error` the first `failures` calls, then records its argument."""
+
+    def __init__(self, failures, error=OSError):
+        self.failures = failures
+        self.error = error
+        self.written = []
+
+    def __call__(self, value):
+        if self.failures:
+            self.failures -= 1
+            raise self.error("disk busy")
+        self.written.append(value)
+
+
+def test_transient_failure_is_retried():
+    queue = WriteBehindQueue(retries=3, backoff=0.001)
+    task = Flaky(2)
+    queue.submit(task, "x")
+    queue.flush()
+    assert task.written == ["x"]
+    assert queue.pending() == 0
+    queue.close()
+
+
+def test_failed_task_is_kept_and_retried_on_close():
+    queue = WriteBehindQueue(retries=1, backoff=0.001)
+    task = Flaky(2)
+    queue.submit(task, "x")
+    queue.flush()
+    assert task.written == []
+    assert queue.pending() == 1
+    queue.close()
+    assert task.written == ["x"]
+    assert queue.pending() == 0
+
+
+def test_failed_keyed_task_is_replaced_by_newer_one():
+    queue = WriteBehindQueue(retries=0, backoff=0.001)
+    task = Flaky(1)
+    queue.submit(task, "old", key="snap")
+    queue.flush()
+    queue.submit(task, "new", key="snap")
+    queue.flush()
+    queue.close()
+    assert task.written == ["new"]
+
+
+def test_other_errors_are_dropped():
+    queue = WriteBehindQueue(retries=3, backoff=0.001)
+    task = Flaky(1, error=ValueError)
+    queue.submit(task, "x")
+    queue.flush()
+    assert queue.pending() == 0
+    queue.close()
+    assert task.written == []
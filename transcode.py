@@ -0,0 +1,167 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AudioTranscoder:
+    """Content-addressed cache of compressed, browser-friendly copies of the sample audio.
+
+    Files are encoded with whichever encoder is available locally (ffmpeg, opusenc or
+    lame) and stored under `cache_dir` by the SHA-256 of their content and encoding
+    settings, so identical files referenced from several sheets are encoded once.
+    When no encoder is available, or encoding fails, the original WAV is served.
+    Encodes run on one long-lived pool, and a path already queued or being encoded is
+    not scheduled again.
+    """
+
+    FORMATS = {
+        "opus": ".ogg",
+        "mp3": ".mp3",
+    }
+
+    def __init__(self, cache_dir: str, fmt: str = "opus", bitrate: str = "32k", workers: int = None):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported format {fmt!r}, expected one of {list(self.FORMATS)}")
+        self.cache_dir = cache_dir
+        self.fmt = fmt
+        self.bitrate = bitrate
+        self.workers = workers or os.cpu_count()
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        self._resolved = {}
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcode")
+        # path -> [mtime_ns, size, content hash], so restarts skip re-hashing unchanged files.
+        self._index = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self._index = json.load(f)
+
+    def encoder_command(self, src, dst):
+        """Return the command that encodes `src` into `dst`, or None if no encoder is available."""
+        if shutil.which("ffmpeg"):
+            codec = "libopus" if self.fmt == "opus" else "libmp3lame"
+            return ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", src,
+                    "-vn", "-c:a", codec, "-b:a", self.bitrate, dst]
+        if self.fmt == "opus" and shutil.which("opusenc"):
+            return ["opusenc", "--quiet", "--bitrate", self.bitrate.rstrip("k"), src, dst]
+        if self.fmt == "mp3" and shutil.which("lame"):
+            return ["lame", "--quiet", "-b", self.bitrate.rstrip("k"), src, dst]
+        return None
+
+    def content_hash(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._index.get(path)
+        if cached is not None and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return cached[2]
+        digest = hashlib.sha256(f"{self.fmt}:{self.bitrate}:".encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        with self._lock:
+            self._index[path] = [stat.st_mtime_ns, stat.st_size, content_hash]
+        return content_hash
+
+    def transcode(self, path):
+        """Encode `path` into the cache if needed and return the path to serve."""
+        content_hash = self.content_hash(path)
+        dst = os.path.join(self.cache_dir, content_hash[:2], content_hash + self.FORMATS[self.fmt])
+        if not os.path.exists(dst):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            tmp_path = f"{dst}.{threading.get_ident()}.tmp{self.FORMATS[self.fmt]}"
+            command = self.encoder_command(path, tmp_path)
+            if command is None or subprocess.run(command).returncode != 0:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                dst = path
+            else:
+                os.replace(tmp_path, dst)
+        with self._lock:
+            self._resolved[path] = dst
+        return dst
+
+    def warm(self, paths):
+        """Transcode every distinct path in parallel and wait; the index is persisted after."""
+        for future in self.warm_in_background(paths):
+            future.result()
+
+    def warm_in_background(self, paths):
+        """Schedule the paths that are not encoded, queued or being encoded; return their futures."""
+        with self._lock:
+            paths = [
+                p for p in dict.fromkeys(paths)
+                if p not in self._resolved and p not in self._pending and os.path.exists(p)
+            ]
+            self._pending.update(paths)
+        return [self._executor.submit(self._transcode_pending, path) for path in paths]
+
+    def save_index(self):
+        with self._lock:
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, self.index_path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _transcode_pending(self, path):
+        try:
+            self.transcode(path)
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+                idle = not self._pending
+            # Persisted once a batch is done rather than after every file.
+            if idle:
+                self.save_index()
+
+    def resolve(self, path):
+        """Return the cached encode of `path` if one is known, otherwise `path` itself."""
+        dst = self._resolved.get(path)
+        if dst is None:
+            # Encoded by an earlier run: the persisted index finds it without re-hashing.
+            entry = self._index.get(path)
+            if entry is None or not os.path.exists(path):
+                return path
+            stat = os.stat(path)
+            if entry[:2] != [stat.st_mtime_ns, stat.st_size]:
+                return path
+            dst = os.path.join(self.cache_dir, entry[2][:2], entry[2] + self.FORMATS[self.fmt])
+            if not os.path.exists(dst):
+                return path
+            with self._lock:
+                self._resolved[path] = dst
+        return dst
+
+
+if __name__ == "__main__":
+    from catalog import SampleCatalog
+
+    parser = argparse.ArgumentParser(description="Pre-transcode every audio file referenced by a sheets directory.")
+    parser.add_argument("dirpath", help="Directory of assignment CSV files")
+    parser.add_argument("--cache-dir", default="./cache/audio")
+    parser.add_argument("--format", default="opus", choices=sorted(AudioTranscoder.FORMATS))
+    parser.add_argument("--bitrate", default="32k")
+    parser.add_argument("--loudness-cache-dir", help="Encode the normalized copies made by loudness.py")
+    args = parser.parse_args()
+
+    paths = []
+    for _, sheet in SampleCatalog.open(args.dirpath).scan():
+        paths.extend(sheet.filepath + sheet.gt)
+    if args.loudness_cache_dir is not None:
+        from loudness import LoudnessNormalizer
+        normalizer = LoudnessNormalizer(args.loudness_cache_dir)
+        paths = [normalizer.resolve(p) for p in paths]
+    transcoder = AudioTranscoder(args.cache_dir, fmt=args.format, bitrate=args.bitrate)
+    transcoder.warm(paths)
+    encoded = sum(transcoder.resolve(p) != p for p in set(paths))
+    print(f"{encoded}/{len(set(paths))} files served from {args.cache_dir}")
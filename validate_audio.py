@@ -0,0 +1,170 @@
+import os
+import json
+import struct
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PCM = 1
+IEEE_FLOAT = 3
+EXTENSIBLE = 0xFFFE
+
+
+class WavFormatError(ValueError):
+    pass
+
+
+def read_wav_header(f):
+    """Parse the RIFF/WAVE headers of the binary file `f`, leaving it at the start of the samples.
+
+    Returns a dict with `format` (PCM or IEEE_FLOAT; extensible files report their
+    sub-format), `channels`, `rate`, `width` (bytes per sample), `data_offset` and
+    `data_size` as declared by the data chunk. Chunks other than fmt and data are skipped.
+    """
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:] != b"WAVE":
+        raise WavFormatError("not a RIFF/WAVE file")
+    header = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            raise WavFormatError("truncated header" if chunk or header is None else "no data chunk")
+        chunk_id, size = struct.unpack("<4sI", chunk)
+        if chunk_id == b"data":
+            if header is None:
+                raise WavFormatError("data chunk before fmt chunk")
+            header.update(data_offset=f.tell(), data_size=size)
+            return header
+        if chunk_id != b"fmt ":
+            f.seek(size + (size & 1), os.SEEK_CUR)
+            continue
+        body = f.read(size + (size & 1))
+        if len(body) < size:
+            raise WavFormatError("truncated header")
+        if size < 16:
+            raise WavFormatError("fmt chunk too short")
+        tag, channels, rate, _, block_align, _ = struct.unpack("<HHIIHH", body[:16])
+        if tag == EXTENSIBLE:
+            if size < 40:
+                raise WavFormatError("extensible fmt chunk too short")
+            # The sub-format GUID starts with the plain format tag.
+            tag = struct.unpack("<H", body[24:26])[0]
+        if tag not in (PCM, IEEE_FLOAT):
+            raise WavFormatError(f"unsupported format {tag}")
+        if channels == 0 or rate == 0 or block_align % channels:
+            raise WavFormatError("invalid fmt chunk")
+        width = block_align // channels
+        if width not in ((1, 2, 3, 4) if tag == PCM else (4, 8)):
+            raise WavFormatError(f"unsupported sample width {width} for format {tag}")
+        header = {"format": tag, "channels": channels, "rate": rate, "width": width}
+
+
+class AudioValidator:
+    """Checks that every WAV referenced by the sheets exists and has a readable header.
+
+    Only the RIFF headers are parsed (no samples are read), which gives the duration,
+    sample rate and channel count; PCM, IEEE-float and extensible files are accepted.
+    Results are cached in `cache_path` by path, mtime and size, so a restart only
+    re-reads files that changed. Headers are read from a thread pool because the work is
+    dominated by file system latency.
+    """
+
+    def __init__(self, cache_path: str = None, workers: int = None, min_duration: float = 0.0):
+        self.cache_path = cache_path
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.min_duration = min_duration
+        self._lock = threading.Lock()
+        # path -> [mtime_ns, size, duration, sample_rate, channels, error or None]
+        self._cache = {}
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path, "r") as f:
+                self._cache = json.load(f)
+
+    def probe(self, path):
+        """Return [mtime_ns, size, duration, sample_rate, channels, error] for `path`."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return [None, None, 0.0, 0, 0, "missing"]
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached is not None and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return cached
+        info = [stat.st_mtime_ns, stat.st_size, 0.0, 0, 0, None]
+        try:
+            with open(path, "rb") as f:
+                header = read_wav_header(f)
+            frames = header["data_size"] // (header["width"] * header["channels"])
+            info[2:5] = [frames / header["rate"], header["rate"], header["channels"]]
+            if header["data_offset"] + header["data_size"] > stat.st_size:
+                info[5] = "truncated"
+        except WavFormatError as e:
+            info[5] = f"not a readable WAV: {e}"
+        except OSError as e:
+            info[5] = f"unreadable: {e.strerror}"
+        if info[5] is None and info[2] <= self.min_duration:
+            info[5] = "empty" if info[2] == 0 else f"shorter than {self.min_duration}s"
+        with self._lock:
+            self._cache[path] = info
+        return info
+
+    def check(self, paths):
+        """Probe every distinct path in parallel; return {path: info} and persist the cache."""
+        paths = list(dict.fromkeys(paths))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = dict(zip(paths, executor.map(self.probe, paths)))
+        if self.cache_path is not None:
+            with self._lock:
+                os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+                tmp_path = self.cache_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(self._cache, f)
+                os.replace(tmp_path, self.cache_path)
+        return results
+
+    def validate(self, catalog):
+        """Check every `filepath` and `gt` in `catalog`; return a list of problem rows.
+
+        Each problem is a (sheet name, row, column, path, error) tuple, with `row` counted
+        from 0 over the data rows of the sheet.
+        """
+        rows = []
+        for sheet_id, sheet in catalog.scan():
+            for column in ("filepath", "gt"):
+                for row, path in enumerate(getattr(sheet, column)):
+                    rows.append((catalog.names[sheet_id], row, column, path))
+        results = self.check(path for *_, path in rows)
+        return [row + (results[row[3]][5],) for row in rows if results[row[3]][5] is not None]
+
+
+def log_problems(problems, limit=20):
+    for name, row, column, path, error in problems[:limit]:
+        logger.warning("%s row %d (%s): %s: %s", name, row, column, path, error)
+    if len(problems) > limit:
+        logger.warning("... and %d more problem rows", len(problems) - limit)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from catalog import SampleCatalog
+
+    parser = argparse.ArgumentParser(description="Check every audio file referenced by the sheets.")
+    parser.add_argument("dirpath", help="Directory of assignment CSV files, or a sheet store")
+    parser.add_argument("--cache", default="./cache/audio_validation.json", help="Header cache file")
+    parser.add_argument("--min-duration", type=float, default=0.0, help="Flag files at or below this length in seconds")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    catalog = SampleCatalog.open(args.dirpath)
+    validator = AudioValidator(args.cache, workers=args.workers, min_duration=args.min_duration)
+    problems = validator.validate(catalog)
+    for name, row, column, path, error in problems:
+        print(f"{name}\t{row}\t{column}\t{path}\t{error}")
+    print(f"{len(problems)} problem rows in {len(catalog)} sheets "
+          f"({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,127 @@
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Errors a later attempt may not hit, e.g. a locked database or a full disk.
+TRANSIENT_ERRORS = (sqlite3.OperationalError, OSError)
+
+
+class WriteBehindQueue:
+    """Runs persistence work on a dedicated writer thread so event handlers return immediately.
+
+    Tasks run in submission order. A task submitted with a `key` replaces a still-pending
+    task with the same key (keeping its place in the queue), so repeated snapshot writes
+    for one tester collapse into the latest one. A `tag` groups tasks (e.g. one tester's
+    writes) so `flush(tag)` waits for that group only. Callers must pass copies of any
+    state that may change before the task runs.
+
+    A task failing with a transient error is retried up to `retries` times, doubling the
+    delay from `backoff` seconds. If it still fails it is kept, counted by `pending`, and
+    tried again by `close` unless a task with the same key replaces it first. Other errors
+    are logged and the task is dropped.
+    """
+
+    def __init__(self, name: str = "mos-writer", retries: int = 3, backoff: float = 0.05):
+        self.retries = retries
+        self.backoff = backoff
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._keyed = {}
+        # tag -> sequence number of the last task submitted with it.
+        self._tagged = {}
+        self._submitted = 0
+        self._done = 0
+        self._failed = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, key=None, tag=None):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            if key is not None and self._failed:
+                self._failed = [task for task in self._failed if task[0] != key]
+            if key is not None and key in self._keyed:
+                task = self._keyed[key]
+                task[1:3] = [fn, args]
+            else:
+                self._submitted += 1
+                # Tasks run in order, so task number n has run once n tasks are done.
+                task = [key, fn, args, self._submitted]
+                if key is not None:
+                    self._keyed[key] = task
+                self._queue.append(task)
+                self._cond.notify_all()
+            if tag is not None:
+                self._tagged[tag] = max(self._tagged.get(tag, 0), task[3])
+
+    def pending(self):
+        """Number of tasks not written yet, including failed ones kept for another attempt."""
+        with self._cond:
+            return self._submitted - self._done + len(self._failed)
+
+    def flush(self, tag=None, timeout=None):
+        """Block until every task submitted before this call (with `tag`, if given) has run."""
+        with self._cond:
+            target = self._submitted if tag is None else self._tagged.get(tag, 0)
+            return self._cond.wait_for(lambda: self._done >= target, timeout=timeout)
+
+    def close(self, timeout=None):
+        """Run the remaining tasks, stop the writer thread and try the failed tasks once more."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return
+        with self._cond:
+            failed, self._failed = self._failed, []
+        for task in failed:
+            if not self._attempt(task[1], task[2]):
+                self._failed.append(task)
+        if self._failed:
+            logger.error("%d write-behind tasks could not be written", len(self._failed))
+
+    def _attempt(self, fn, args):
+        """Run a task, retrying transient errors; return False if it should be kept for later."""
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                fn(*args)
+                return True
+            except TRANSIENT_ERRORS:
+                if attempt == self.retries:
+                    logger.exception("Write-behind task %r failed %d times, keeping it for retry",
+                                     getattr(fn, "__qualname__", fn), attempt + 1)
+                    return False
+                time.sleep(delay)
+                delay *= 2
+            except Exception:
+                logger.exception("Write-behind task %r failed", getattr(fn, "__qualname__", fn))
+                return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                task = self._queue.popleft()
+                key, fn, args, sequence = task
+                if key is not None:
+                    self._keyed.pop(key, None)
+            written = self._attempt(fn, args)
+            with self._cond:
+                # A task with the same key submitted while this one ran supersedes it.
+                if not written and (key is None or key not in self._keyed):
+                    self._failed.append(task)
+                self._done = sequence
+                # Drop tags whose tasks have all run, so the map stays small.
+                if sequence % 1024 == 0:
+                    self._tagged = {t: n for t, n in self._tagged.items() if n > sequence}
+                self._cond.notify_all()